@@ -0,0 +1,103 @@
+"""
+Compare the xlsx reader engines in utils/upload_readers.py.
+
+Generates a seeded inventory workbook (100k rows by default, with extra
+columns the importer ignores) and times every installed engine, reading all
+columns and only the columns the normalizer needs.
+
+Run from the backend directory:
+    python -m benchmarks.excel_engines
+    python -m benchmarks.excel_engines --rows 20000 --extra-columns 5
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "")
+
+import pandas as pd
+
+from utils.column_profiles import detect_data_type, needed_upload_columns
+from utils.upload_readers import EXCEL_ENGINES
+
+INVENTORY_COLUMNS = [
+    "SKU", "Medicine Name", "Batch No", "Quantity", "Expiry Date",
+    "Category", "MRP", "Cost", "Purchase Date", "Manufacturer",
+]
+
+
+def generate_workbook(path: str, rows: int, extra_columns: int, seed: int):
+    """Write a wide inventory sheet with openpyxl's write-only mode"""
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    names = [f"Medicine {i}" for i in range(2000)]
+    categories = ["Antibiotics", "Pain Relief", "Diabetes", "Cardiac", "General"]
+    today = datetime(2025, 1, 1)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(INVENTORY_COLUMNS + [f"Extra {i}" for i in range(extra_columns)])
+    for i in range(rows):
+        sheet.append([
+            f"SKU-{i}",
+            rng.choice(names),
+            f"B{i}",
+            rng.randint(1, 500),
+            today + timedelta(days=rng.randint(-30, 900)),
+            rng.choice(categories),
+            round(rng.uniform(1, 500), 2),
+            round(rng.uniform(1, 300), 2),
+            today - timedelta(days=rng.randint(0, 365)),
+            f"Pharma {rng.randint(1, 50)}",
+        ] + [rng.random() for _ in range(extra_columns)])
+    workbook.save(path)
+
+
+def select_columns(header):
+    return needed_upload_columns(header, detect_data_type(pd.DataFrame(columns=header)))
+
+
+def time_engine(engine: str, path: str, selector) -> tuple:
+    start = time.perf_counter()
+    with open(path, "rb") as stream:
+        rows = sum(len(frame) for frame in EXCEL_ENGINES[engine](stream, 50_000, selector))
+    return rows, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--extra-columns", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workbook", help="reuse or create the workbook at this path")
+    args = parser.parse_args()
+
+    path = args.workbook or os.path.join(tempfile.gettempdir(), f"bench-{args.rows}x{args.extra_columns}-{args.seed}.xlsx")
+    if not os.path.exists(path):
+        print(f"Generating {args.rows} rows x {len(INVENTORY_COLUMNS) + args.extra_columns} columns -> {path}")
+        generate_workbook(path, args.rows, args.extra_columns, args.seed)
+    print(f"Workbook: {path} ({os.path.getsize(path) / (1024 * 1024):.1f} MB)")
+
+    installed = {
+        "calamine": importlib.util.find_spec("python_calamine") is not None,
+        "openpyxl": importlib.util.find_spec("openpyxl") is not None,
+    }
+    print(f"{'engine':<10} {'columns':<9} {'rows':>8} {'seconds':>8} {'rows/s':>9}")
+    for engine in EXCEL_ENGINES:
+        if not installed.get(engine):
+            print(f"{engine:<10} not installed")
+            continue
+        for label, selector in (("all", None), ("needed", select_columns)):
+            rows, seconds = time_engine(engine, path, selector)
+            print(f"{engine:<10} {label:<9} {rows:>8} {seconds:>8.2f} {rows / seconds:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Ingestion benchmark suite.
+
+Generates seeded inventory and sales files (1k, 100k and 1M rows by default)
+in CSV, xlsx and JSON. Each case runs these phases through
+upload_inventory_file (POST /api/inventory/upload), against a fresh on-disk
+SQLite database:
+
+    parse        read the inventory file into frames, no database
+    import       inventory into an empty database (new medicines and batches)
+    reimport     the same inventory file again (existing medicines and batches)
+    sales        a sales file drawn from the imported batches
+    sales-again  the same sales file again (already imported, a no-op)
+
+Every phase reports rows/s, peak RSS and the number of SQL statements.
+Results are appended to benchmarks/results/ingestion.jsonl with the git
+revision. Each row is compared with the previous run of the same case.
+Generated files are cached in the temp directory, keyed by size and seed.
+
+Run from the backend directory:
+    python -m benchmarks.ingestion
+    python -m benchmarks.ingestion --sizes 1k,100k --formats csv,json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("GEMINI_API_KEY", "")
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+FORMATS = ("csv", "xlsx", "json")
+PHASES = ("parse", "import", "reimport", "sales", "sales-again")
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "ingestion.jsonl")
+
+# Column names as in the download-template file and a typical POS export
+STEMS = [
+    "Paracetamol", "Azithromycin", "Metformin", "Amoxicillin", "Ibuprofen", "Cetirizine",
+    "Pantoprazole", "Amlodipine", "Omeprazole", "Losartan", "Atorvastatin", "Montelukast",
+    "Ciprofloxacin", "Dolo", "Vitamin C", "Telmisartan", "Clopidogrel", "Aspirin",
+    "Ranitidine", "Levocetirizine",
+]
+CATEGORIES = ["Antibiotic", "Pain Relief", "Vitamin", "Cardiac", "Gastric"]
+SUPPLIERS = ["ABC Pharma", "XYZ Healthcare", "Global Meds", "Sun Pharma", "Cipla", "Dr Reddys"]
+
+
+def generate_inventory(rows: int, seed: int) -> pd.DataFrame:
+    """One new batch per row, spread over rows / 50 medicines; 10% already expired"""
+    rng = np.random.default_rng(seed)
+    medicines = max(rows // 50, 20)
+    medicine = rng.integers(0, medicines, rows)
+    stems = np.array(STEMS)[medicine % len(STEMS)]
+    names = pd.Series(stems).str.cat(pd.Series(medicine).astype(str), sep=" ") + "mg"
+    expired = rng.random(rows) < 0.1
+    # Fixed dates keep the files (and the expired share) identical over time
+    expiry = np.where(
+        expired,
+        np.datetime64("2020-01-01") + rng.integers(0, 365, rows),
+        np.datetime64("2035-01-01") + rng.integers(0, 730, rows),
+    )
+    price = np.round(rng.uniform(2, 60, medicines), 2)
+    return pd.DataFrame({
+        "Name": names,
+        "Category": np.array(CATEGORIES)[medicine % len(CATEGORIES)],
+        "Quantity": rng.integers(5, 200, rows),
+        "Price": price[medicine],
+        "Expiry Date": pd.to_datetime(expiry).strftime("%Y-%m-%d"),
+        "Batch No": [f"B{seed}-{i:07d}" for i in range(rows)],
+        "Supplier": np.array(SUPPLIERS)[rng.integers(0, len(SUPPLIERS), rows)],
+    })
+
+
+def generate_sales(inventory: pd.DataFrame, rows: int, seed: int) -> pd.DataFrame:
+    """Sales of inventory batches, three lines per invoice"""
+    rng = np.random.default_rng(seed + 1)
+    picked = inventory.iloc[rng.integers(0, len(inventory), rows)]
+    dates = np.datetime64("2024-01-01") + rng.integers(0, 365, rows)
+    return pd.DataFrame({
+        "Transaction_ID": [f"T{seed}-{i // 3:07d}" for i in range(rows)],
+        "Date": pd.to_datetime(dates).strftime("%Y-%m-%d"),
+        "Drug_Name": picked["Name"].to_numpy(),
+        "Batch_Number": picked["Batch No"].to_numpy(),
+        "Qty_Sold": rng.integers(1, 4, rows),
+        "MRP_Unit_Price": picked["Price"].to_numpy(),
+    })
+
+
+def write_frame(df: pd.DataFrame, path: str, fmt: str):
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "json":
+        df.to_json(path, orient="records")
+    else:
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(list(df.columns))
+        for row in df.itertuples(index=False):
+            sheet.append([value.item() if isinstance(value, np.generic) else value for value in row])
+        workbook.save(path)
+
+
+def dataset_files(data_dir: str, size: str, fmt: str, seed: int) -> tuple:
+    """Paths of the inventory and sales files for a case, generated on first use"""
+    rows = SIZES[size]
+    paths = []
+    for kind in ("inventory", "sales"):
+        path = os.path.join(data_dir, f"{kind}-{size}-{seed}.{fmt}")
+        if not os.path.exists(path):
+            print(f"Generating {path}")
+            inventory = generate_inventory(rows, seed)
+            df = inventory if kind == "inventory" else generate_sales(inventory, rows, seed)
+            write_frame(df, path + ".tmp", fmt)
+            os.replace(path + ".tmp", path)
+        paths.append(path)
+    return tuple(paths)
+
+
+def reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM, the peak resident set size
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        # Elsewhere only the peak of the whole process is available
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class Bench:
+    """The app wired to a benchmark database, plus SQL statement counting"""
+
+    def __init__(self, db_path: str):
+        os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        # The categorizer retrains on the imported medicines; keep that model
+        # next to the benchmark database instead of the app's
+        os.environ["LOCAL_CATEGORIZER_PATH"] = os.path.splitext(db_path)[0] + "-category_model.npz"
+        with contextlib.redirect_stdout(io.StringIO()):
+            from fastapi.testclient import TestClient
+            from sqlalchemy import event
+
+            import main
+            from auth import get_current_active_user
+            from database import Base, SessionLocal, engine
+            from migrations import run_migrations
+            from ml_models import categorization, category_cache
+            from models import User, UserRole
+            from utils.ingestion import read_upload
+            from utils.upload_jobs import get_upload_job
+
+        # config.py loads .env with override=True, which could point elsewhere
+        if os.path.abspath(engine.url.database) != os.path.abspath(db_path):
+            raise SystemExit(f"DATABASE_URL from .env ({engine.url}) overrides the benchmark database")
+        # Categories come from the files; never call Gemini from a benchmark
+        categorization.model = None
+
+        self.engine = engine
+        self.base = Base
+        self.session = SessionLocal
+        self.run_migrations = run_migrations
+        self.category_cache = category_cache
+        self.user_model = (User, UserRole)
+        self.read_upload = read_upload
+        self.get_upload_job = get_upload_job
+        self.statements = 0
+        event.listen(engine, "before_cursor_execute", self._count_statement)
+
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        main.app.dependency_overrides[get_current_active_user] = lambda: self.user
+        self.client = TestClient(main.app)
+        self.user = None
+
+    def _count_statement(self, *args):
+        self.statements += 1
+
+    def reset_database(self):
+        """Empty schema, one user, cold category cache"""
+        User, UserRole = self.user_model
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.base.metadata.drop_all(bind=self.engine)
+            self.base.metadata.create_all(bind=self.engine)
+            self.run_migrations(self.engine)
+        self.category_cache._lru.clear()
+        db = self.session()
+        user = User(email="bench@pharmacy.com", full_name="Bench", role=UserRole.ADMIN, hashed_password="-", is_active=True)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        db.close()
+        self.user = user
+
+    def parse(self, path: str) -> dict:
+        with open(path, "rb") as stream:
+            _, frames = self.read_upload(os.path.basename(path), stream)
+            return {"total_rows": sum(len(frame) for frame in frames), "error_count": 0}
+
+    def upload(self, path: str) -> dict:
+        with open(path, "rb") as stream:
+            response = self.client.post("/api/inventory/upload", files={"file": (os.path.basename(path), stream)})
+        response.raise_for_status()
+        job = self.get_upload_job(response.json()["job_id"])
+        return job.future.result()
+
+    def measure(self, run, path: str) -> dict:
+        self.statements = 0
+        reset_peak_rss()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run(path)
+        seconds = time.perf_counter() - start
+        return {
+            "rows": result["total_rows"],
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(result["total_rows"] / seconds),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "sql_statements": self.statements,
+            "error_count": result["error_count"],
+        }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(path: str) -> dict:
+    """The latest saved record of each (format, size, phase)"""
+    latest = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                latest[(record["format"], record["size"], record["phase"])] = record
+    return latest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(SIZES), help="comma-separated, from " + ", ".join(SIZES))
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "pharmacy-bench"))
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="JSON lines file the results are appended to")
+    parser.add_argument("--no-save", action="store_true", help="print the results without saving them")
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(",")
+    formats = args.formats.split(",")
+    unknown = [s for s in sizes if s not in SIZES] + [f for f in formats if f not in FORMATS]
+    if unknown:
+        parser.error(f"unknown sizes/formats: {unknown}")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    bench = Bench(os.path.join(args.data_dir, "bench.db"))
+    previous = previous_results(args.results)
+    run_info = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} cpu",
+    }
+
+    records = []
+    print(f"{'format':<6} {'size':>5} {'phase':<12} {'rows':>8} {'seconds':>8} {'rows/s':>8} {'peak MB':>8} {'SQL':>7}  vs last")
+    for size in sizes:
+        for fmt in formats:
+            inventory_path, sales_path = dataset_files(args.data_dir, size, fmt, args.seed)
+            bench.reset_database()
+            steps = {
+                "parse": (bench.parse, inventory_path),
+                "import": (bench.upload, inventory_path),
+                "reimport": (bench.upload, inventory_path),
+                "sales": (bench.upload, sales_path),
+                "sales-again": (bench.upload, sales_path),
+            }
+            for phase in PHASES:
+                record = dict(run_info, format=fmt, size=size, phase=phase, **bench.measure(*steps[phase]))
+                records.append(record)
+                last = previous.get((fmt, size, phase))
+                change = f"{record['rows_per_second'] / last['rows_per_second'] - 1:+.0%}" if last else ""
+                print(
+                    f"{fmt:<6} {size:>5} {phase:<12} {record['rows']:>8} {record['seconds']:>8.2f} "
+                    f"{record['rows_per_second']:>8} {record['peak_rss_mb']:>8.0f} {record['sql_statements']:>7}  {change}"
+                )
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, "a") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        print(f"Results appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -20,7 +20,19 @@ class Settings(BaseSettings):
     CORS_ORIGINS: List[str] = ["http://localhost:5173", "http://127.0.0.1:5173"]
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY") # Explicit fetch after reload
     ALGORITHM: str = "HS256"
-    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10 MB
+    MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024 * 1024  # 10 GB (uploads are streamed); mirrored in frontend/src/api/uploadLimits.js
+    UPLOAD_CHUNK_ROWS: int = 50_000
+    EXCEL_ENGINE: str = "auto"  # xlsx reader: auto, calamine (python-calamine) or openpyxl
+    UPLOAD_WORKERS: int = 2
+    UPLOAD_PARSE_PROCESSES: Optional[int] = None  # batch upload parser processes, defaults to the CPU count
+    UPLOAD_JOB_TTL_SECONDS: int = 3600  # finished jobs are forgotten after an hour
+    CATEGORIZATION_BATCH_SIZE: int = 50  # medicines per Gemini prompt
+    CATEGORIZATION_MAX_WORKERS: int = 4  # concurrent Gemini prompts
+    CATEGORY_CACHE_SIZE: int = 10_000  # in-process LRU entries in front of category_cache
+    LOCAL_CATEGORIZER_ENABLED: bool = True
+    LOCAL_CATEGORIZER_PATH: Optional[str] = None  # defaults to ml_models/category_model.npz
+    LOCAL_CATEGORIZER_MIN_SAMPLES: int = 50  # labelled medicines needed before training
+    LOCAL_CATEGORIZER_MIN_CONFIDENCE: float = 0.6  # below this, names go to Gemini
     EXPIRY_ALERT_DAYS: List[int] = [30, 60, 90]
 
     class Config:
@@ -22,6 +22,21 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def dialect_insert(bind):
+    """
+    The dialect-specific insert() construct (with on_conflict_do_nothing /
+    on_conflict_do_update) for SQLite and PostgreSQL, or None elsewhere.
+    """
+    name = bind.dialect.name
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
@@ -4,8 +4,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from database import engine, Base
 from routers import auth, inventory, forecasting, alerts, waste, dashboard, chatbot_v3, suppliers, debug, orders
 from config import settings
+from migrations import run_migrations
+from utils.pagination import NEXT_CURSOR_HEADER
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app = FastAPI(
     title="Smart Pharmacy Inventory API",
@@ -18,6 +21,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
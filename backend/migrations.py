@@ -0,0 +1,71 @@
+"""
+Lightweight schema migrations for existing databases.
+
+Base.metadata.create_all() only creates missing tables. Columns and indexes
+added to models after a database was created are applied here, so older
+databases keep working without a separate migration tool.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from database import Base
+from models import medicine_name_key
+from utils.medicine_search import create_search_index
+from utils.stock_summary import rebuild_stock_summaries
+
+
+def add_missing_columns(conn, inspector):
+    """ALTER TABLE ... ADD COLUMN for model columns the database does not have yet"""
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            print(f"DEBUG: Migration - adding column {table.name}.{column.name}")
+            conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+
+def create_missing_indexes(conn, inspector):
+    """Build the model indexes (e.g. composite ones added later) the database lacks"""
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)} if table.name in existing_tables else set()
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            print(f"DEBUG: Migration - creating index {index.name}")
+            index.create(conn, checkfirst=True)
+
+
+def backfill_medicine_name_keys(conn):
+    rows = conn.execute(text("SELECT id, name FROM medicines WHERE name_key IS NULL")).fetchall()
+    if rows:
+        print(f"DEBUG: Migration - backfilling name_key for {len(rows)} medicines")
+        conn.execute(
+            text("UPDATE medicines SET name_key = :name_key WHERE id = :id"),
+            [{"id": row.id, "name_key": medicine_name_key(row.name)} for row in rows]
+        )
+
+
+def backfill_stock_summaries(conn):
+    """Fill medicine_stock_summary once, when it is new and medicines exist"""
+    if conn.execute(text("SELECT 1 FROM medicine_stock_summary LIMIT 1")).first():
+        return
+    if conn.execute(text("SELECT 1 FROM medicines LIMIT 1")).first():
+        count = rebuild_stock_summaries(conn)
+        print(f"DEBUG: Migration - built the stock summary of {count} medicines")
+
+
+def run_migrations(engine: Engine):
+    """Bring an existing database up to date with the models"""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        add_missing_columns(conn, inspector)
+        backfill_medicine_name_keys(conn)
+        create_missing_indexes(conn, inspector)
+        backfill_stock_summaries(conn)
+        create_search_index(conn)
@@ -1,8 +1,16 @@
 """
 Medicine categorization using ML/NLP
 """
+import json
+import math
+import os
 import re
-from typing import Dict, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
 
 
 # Common medicine categories and keywords
@@ -82,35 +90,418 @@ def categorize_medicine(name: str, description: Optional[str] = None) -> str:
     """
     Categorize medicine using AI, falling back to keyword matching
     """
-    # Try AI first
+    # A confident local prediction avoids the network entirely
+    if local_categorizer is not None:
+        category, confidence = local_categorizer.predict(name)
+        if category and confidence >= settings.LOCAL_CATEGORIZER_MIN_CONFIDENCE:
+            return category
+
+    # Try AI next
     ai_category = categorize_medicine_ai(name, description)
     if ai_category:
         return ai_category
 
     # Fallback to legacy keyword matching
-    if not name:
-        return "General"
-    
-    # Combine name and description for analysis
-    text = name.lower()
-    if description:
-        text += " " + description.lower()
-    
-    # Score each category
-    category_scores = {}
-    for category, keywords in MEDICINE_CATEGORIES.items():
-        if category == "General":
-            continue
-        score = 0
-        for keyword in keywords:
-            if keyword.lower() in text:
-                score += 1
-        if score > 0:
-            category_scores[category] = score
-    
-    # Return category with highest score, or General if no match
-    if category_scores:
-        return max(category_scores.items(), key=lambda x: x[1])[0]
-    
-    return "General"
+    return categorize_medicine_keywords(name, description)
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """
+    Regex alternation shaped as a trie ("a(?:moxicillin|spirin)|..."), so the
+    engine checks one character per position instead of every keyword.
+    Greedy optional groups make it match the longest keyword.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        alternatives = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Compiled keyword matcher over MEDICINE_CATEGORIES.
+
+    Scoring is the legacy one: a category scores one point per distinct
+    keyword that occurs as a substring of the text, the highest score wins and
+    ties go to the category listed first. All keywords are found in one regex
+    scan: a lookahead over a trie-shaped alternation reports the longest
+    keyword starting at each position, and any shorter keyword starting there
+    is necessarily one of its prefixes.
+    """
+
+    def __init__(self, categories: Dict[str, List[str]]):
+        self.categories = [category for category in categories if category != "General"]
+        self.keyword_categories: Dict[str, List[int]] = {}
+        for i, category in enumerate(self.categories):
+            for keyword in categories[category]:
+                self.keyword_categories.setdefault(keyword.lower(), []).append(i)
+
+        keywords = list(self.keyword_categories)
+        alternation = _trie_pattern(keywords)
+        self.any_pattern = re.compile(alternation)
+        self.pattern = re.compile("(?=(" + alternation + "))")
+        self.prefixes = {k: [p for p in keywords if k.startswith(p)] for k in keywords}
+        self._labels = self.categories + ["General"]
+
+    def _best_index(self, text: str) -> int:
+        """Index into self._labels for an already lower-cased text"""
+        # Most names contain no keyword at all: one plain search rules them out
+        if not self.any_pattern.search(text):
+            return len(self.categories)
+
+        found = set()
+        for match in self.pattern.finditer(text):
+            found.update(self.prefixes[match.group(1)])
+
+        scores = [0] * len(self.categories)
+        for keyword in found:
+            for i in self.keyword_categories[keyword]:
+                scores[i] += 1
+        return max(range(len(scores)), key=scores.__getitem__)  # first max wins ties
+
+    def categorize(self, name: str, description: Optional[str] = None) -> str:
+        if not name:
+            return "General"
+
+        # Combine name and description for analysis
+        text = name.lower()
+        if description:
+            text += " " + description.lower()
+        return self._labels[self._best_index(text)]
+
+    def categorize_series(self, names: pd.Series, descriptions: Optional[pd.Series] = None) -> pd.Series:
+        """Vectorized categorize() over a whole Series of names (and optional descriptions)"""
+        names = pd.Series(names)
+        valid = names.notna() & (names.astype(str) != "")
+        text = names.where(valid, "").astype(str).str.lower()
+        if descriptions is not None:
+            descriptions = pd.Series(descriptions, index=names.index)
+            has_description = descriptions.notna() & (descriptions.astype(str) != "")
+            text = text.where(~has_description, text + " " + descriptions.astype(str).str.lower())
+
+        # Catalogs repeat names a lot: score each distinct text once
+        codes, uniques = pd.factorize(text)
+
+        # Search each keyword across all distinct texts joined by newlines
+        # (no keyword contains one) with str.find, which runs at memchr speed,
+        # then map match positions back to rows
+        joined = "\n".join(uniques)
+        starts = np.zeros(len(uniques), dtype=np.int64)
+        if len(uniques) > 1:
+            starts[1:] = np.cumsum(np.fromiter((len(t) + 1 for t in uniques[:-1]), dtype=np.int64, count=len(uniques) - 1))
+
+        hit_rows, hit_categories = [], []
+        for keyword, category_indexes in self.keyword_categories.items():
+            positions = []
+            pos = joined.find(keyword)
+            while pos != -1:
+                positions.append(pos)
+                pos = joined.find(keyword, pos + 1)
+            if not positions:
+                continue
+            rows = np.unique(np.searchsorted(starts, np.asarray(positions, dtype=np.int64), side="right") - 1)
+            for i in category_indexes:
+                hit_rows.append(rows)
+                hit_categories.append(np.full(len(rows), i, dtype=np.int64))
+
+        scores = np.zeros((len(uniques), len(self.categories)), dtype=np.int32)
+        if hit_rows:
+            np.add.at(scores, (np.concatenate(hit_rows), np.concatenate(hit_categories)), 1)
+        best = scores.argmax(axis=1)  # first max wins ties, like max() over the dict
+        best[scores.max(axis=1) == 0] = len(self.categories)
+
+        best = best[codes]
+        best[~valid.to_numpy(dtype=bool)] = len(self.categories)
+        return pd.Series(np.array(self._labels, dtype=object)[best], index=names.index)
+
+
+keyword_matcher = KeywordMatcher(MEDICINE_CATEGORIES)
+
+
+def categorize_medicine_keywords(name: str, description: Optional[str] = None) -> str:
+    """Legacy keyword matching: the category with the most keyword hits wins"""
+    return keyword_matcher.categorize(name, description)
+
+
+def categorize_series_keywords(names: pd.Series, descriptions: Optional[pd.Series] = None) -> pd.Series:
+    """Keyword-categorize a whole Series of names in one call (no AI)"""
+    return keyword_matcher.categorize_series(names, descriptions)
+
+
+class LocalCategorizer:
+    """
+    Offline medicine categorizer: character n-gram TF-IDF with a
+    nearest-centroid (cosine) linear model, trained on names whose category
+    is already known. Prediction is a handful of dict lookups and one small
+    dot product, and needs no network.
+    """
+
+    NGRAM_RANGE = (2, 4)
+    # Softmax temperature turning cosine similarities into a confidence
+    SCALE = 10.0
+
+    def __init__(self, classes: List[str], vocabulary: Dict[str, int], idf: np.ndarray, centroids: np.ndarray):
+        self.classes = classes
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.centroids = centroids  # (n_classes, n_features), rows L2-normalized
+
+    @classmethod
+    def ngrams(cls, name: str) -> Counter:
+        text = " " + " ".join(str(name).lower().split()) + " "
+        low, high = cls.NGRAM_RANGE
+        return Counter(
+            text[i:i + n]
+            for n in range(low, high + 1)
+            for i in range(len(text) - n + 1)
+        )
+
+    def _vector(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Sparse (indices, weights) TF-IDF vector, L2-normalized"""
+        counts = [(self.vocabulary[g], c) for g, c in self.ngrams(name).items() if g in self.vocabulary]
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        indices = np.fromiter((i for i, _ in counts), dtype=np.int64, count=len(counts))
+        weights = np.fromiter((1 + math.log(c) for _, c in counts), dtype=float, count=len(counts)) * self.idf[indices]
+        return indices, weights / np.linalg.norm(weights)
+
+    @classmethod
+    def fit(cls, names: List[str], labels: List[str]) -> "LocalCategorizer":
+        classes = sorted(set(labels))
+        docs = [cls.ngrams(name) for name in names]
+
+        # Sorted vocabulary keeps training deterministic
+        document_frequency = Counter(g for doc in docs for g in doc)
+        vocabulary = {g: i for i, g in enumerate(sorted(document_frequency))}
+        df = np.array([document_frequency[g] for g in sorted(document_frequency)], dtype=float)
+        idf = np.log((1 + len(docs)) / (1 + df)) + 1
+
+        model = cls(classes, vocabulary, idf, np.zeros((len(classes), len(vocabulary))))
+        class_index = {c: i for i, c in enumerate(classes)}
+        for name, label in zip(names, labels):
+            indices, weights = model._vector(name)
+            model.centroids[class_index[label], indices] += weights
+        norms = np.linalg.norm(model.centroids, axis=1, keepdims=True)
+        model.centroids /= np.where(norms == 0, 1, norms)
+        return model
+
+    def predict(self, name: str) -> Tuple[Optional[str], float]:
+        """(category, confidence in [0, 1]); (None, 0.0) if no n-gram is known"""
+        indices, weights = self._vector(name or "")
+        if not len(indices):
+            return None, 0.0
+        similarities = self.centroids[:, indices] @ weights
+        exp = np.exp(self.SCALE * (similarities - similarities.max()))
+        probabilities = exp / exp.sum()
+        best = int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best])
+
+    def save(self, path: str):
+        ngrams = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez_compressed(
+            path,
+            classes=np.array(self.classes),
+            ngrams=np.array(ngrams),
+            idf=self.idf,
+            centroids=self.centroids,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalCategorizer":
+        data = np.load(path, allow_pickle=False)
+        vocabulary = {g: i for i, g in enumerate(data["ngrams"].tolist())}
+        return cls(data["classes"].tolist(), vocabulary, data["idf"], data["centroids"])
+
+
+local_categorizer: Optional[LocalCategorizer] = None
+_local_categorizer_checked = False
+
+
+def local_categorizer_path() -> str:
+    return settings.LOCAL_CATEGORIZER_PATH or os.path.join(os.path.dirname(__file__), "category_model.npz")
+
+
+def train_local_categorizer(db, save: bool = True) -> Optional[LocalCategorizer]:
+    """
+    Train the local categorizer on the categories stored in the medicines
+    table ("General" is left out so unknown names stay low-confidence).
+    Returns None if there is not enough labelled data yet.
+    """
+    global local_categorizer
+    from models import Medicine
+
+    rows = (
+        db.query(Medicine.name_key, Medicine.category)
+        .filter(Medicine.category.isnot(None), Medicine.category != "General", Medicine.name_key.isnot(None))
+        .order_by(Medicine.id)
+        .all()
+    )
+    # One label per name (the latest wins)
+    labelled = {name_key: category for name_key, category in rows if name_key}
+    if len(labelled) < settings.LOCAL_CATEGORIZER_MIN_SAMPLES or len(set(labelled.values())) < 2:
+        print(f"DEBUG: Not enough labelled medicines ({len(labelled)}) to train the local categorizer")
+        return None
+
+    names = sorted(labelled)
+    model = LocalCategorizer.fit(names, [labelled[n] for n in names])
+    if save:
+        model.save(local_categorizer_path())
+    local_categorizer = model
+    print(f"DEBUG: Trained local categorizer on {len(names)} medicines, {len(model.classes)} categories")
+    return model
+
+
+def get_local_categorizer(db=None) -> Optional[LocalCategorizer]:
+    """
+    The loaded local categorizer: read from disk on first use, or trained
+    from the database if no saved model exists. Checked once per process;
+    call train_local_categorizer() to refresh it.
+    """
+    global local_categorizer, _local_categorizer_checked
+    if local_categorizer is not None or _local_categorizer_checked or not settings.LOCAL_CATEGORIZER_ENABLED:
+        return local_categorizer
+    _local_categorizer_checked = True
+
+    path = local_categorizer_path()
+    try:
+        if os.path.exists(path):
+            local_categorizer = LocalCategorizer.load(path)
+        elif db is not None:
+            train_local_categorizer(db)
+    except Exception as e:
+        print(f"WARNING: Local categorizer unavailable: {e}")
+        local_categorizer = None
+    return local_categorizer
+
+
+def _match_category(text: str) -> Optional[str]:
+    """Map a model answer onto one of MEDICINE_CATEGORIES"""
+    if not isinstance(text, str):
+        return None
+    text = text.strip()
+    if text in MEDICINE_CATEGORIES:
+        return text
+    for valid_cat in MEDICINE_CATEGORIES:
+        if valid_cat.lower() in text.lower():
+            return valid_cat
+    return None
+
+
+def categorize_medicines_ai_batch(items: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+    """
+    Categorize several medicines with a single Gemini prompt.
+
+    Returns one entry per item (None where the model gave no usable answer,
+    or for every item if the call fails).
+    """
+    global FAILED_API_CALLS
+
+    if not items or not model or FAILED_API_CALLS >= MAX_FAILED_CALLS:
+        return [None] * len(items)
+
+    lines = "\n".join(
+        f"{i}. {name} (Description: {description or 'N/A'})"
+        for i, (name, description) in enumerate(items, start=1)
+    )
+    try:
+        prompt = f"""
+        Categorize each of the following medicines into exactly one of these categories:
+        {list(MEDICINE_CATEGORIES.keys())}
+        
+        Medicines:
+        {lines}
+        
+        Return ONLY a JSON object mapping each medicine number to its category name,
+        for example {{"1": "Pain Relief", "2": "Antibiotics"}}.
+        """
+        response = model.generate_content(prompt)
+        text = response.text.strip()
+        # Strip markdown code fences if the model added them
+        text = re.sub(r"^```(?:json)?|```$", "", text, flags=re.MULTILINE).strip()
+        answers = json.loads(text)
+        if not isinstance(answers, dict):
+            return [None] * len(items)
+        return [_match_category(answers.get(str(i))) for i in range(1, len(items) + 1)]
+    except Exception as e:
+        error_str = str(e)
+        print(f"AI Batch Categorization failed: {error_str}")
+
+        # Check for 403/PermissionDenied or Quota exceeded
+        if "403" in error_str or "PermissionDenied" in error_str or "quota" in error_str.lower():
+            print("CRITICAL: API Key blocked or quota exceeded. Disabling AI for this session.")
+            FAILED_API_CALLS = MAX_FAILED_CALLS + 1
+
+        return [None] * len(items)
+
+
+def ai_available() -> bool:
+    """True while Gemini is configured and the circuit breaker has not tripped"""
+    return bool(model) and FAILED_API_CALLS < MAX_FAILED_CALLS
+
+
+def categorize_medicines_with_source(
+    items: List[Tuple[str, Optional[str]]],
+    batch_size: Optional[int] = None,
+    max_workers: Optional[int] = None,
+) -> List[Tuple[str, str]]:
+    """
+    Categorize many (name, description) pairs at once.
+
+    The local categorizer answers first; only names it is not confident
+    about (below LOCAL_CATEGORIZER_MIN_CONFIDENCE) are sent to Gemini,
+    ``batch_size`` per prompt with up to ``max_workers`` prompts in flight.
+    Anything still unanswered falls back to keyword matching. Returns
+    (category, source) pairs in input order, where source is "local", "ai"
+    or "keyword".
+    """
+    if not items:
+        return []
+    batch_size = batch_size or settings.CATEGORIZATION_BATCH_SIZE
+    max_workers = max_workers or settings.CATEGORIZATION_MAX_WORKERS
+
+    results: List[Optional[Tuple[str, str]]] = [None] * len(items)
+    if local_categorizer is not None:
+        for i, (name, _) in enumerate(items):
+            category, confidence = local_categorizer.predict(name)
+            if category and confidence >= settings.LOCAL_CATEGORIZER_MIN_CONFIDENCE:
+                results[i] = (category, "local")
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending and ai_available():
+        pending_items = [items[i] for i in pending]
+        batches = [pending_items[start:start + batch_size] for start in range(0, len(pending_items), batch_size)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # map() yields in submission order, so results stay aligned
+            ai_results = [
+                category
+                for batch_result in executor.map(categorize_medicines_ai_batch, batches)
+                for category in batch_result
+            ]
+        for i, category in zip(pending, ai_results):
+            if category:
+                results[i] = (category, "ai")
+
+    return [
+        result or (categorize_medicine_keywords(name, description), "keyword")
+        for result, (name, description) in zip(results, items)
+    ]
+
 
+def categorize_medicines(
+    items: List[Tuple[str, Optional[str]]],
+    batch_size: Optional[int] = None,
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """Batch categorization returning just the categories, in input order"""
+    return [category for category, _ in categorize_medicines_with_source(items, batch_size, max_workers)]
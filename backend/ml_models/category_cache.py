@@ -0,0 +1,244 @@
+"""
+Persistent medicine categorization cache.
+
+Categories are remembered in the ``category_cache`` table, keyed by the
+normalized medicine name plus an optional normalized manufacturer, with an
+in-process LRU in front of it. Uploads and create_medicine consult the cache
+before any AI call, so a name is categorized by Gemini once, not on every
+upload, process or restart.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import dialect_insert
+from models import CategoryCache, CategorySource, medicine_name_key
+from ml_models.categorization import ai_available, categorize_medicines_with_source, get_local_categorizer
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+# A better source replaces a cached entry, never the other way round
+SOURCE_RANK = {
+    CategorySource.KEYWORD: 0,
+    CategorySource.LOCAL: 1,
+    CategorySource.AI: 2,
+    CategorySource.MANUAL: 3,
+}
+
+CacheKey = Tuple[str, str]
+CacheEntry = Tuple[str, CategorySource]
+
+
+class _LRU:
+    """Small thread-safe LRU of cache key -> (category, source)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def put(self, key: CacheKey, entry: CacheEntry):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = _LRU(settings.CATEGORY_CACHE_SIZE)
+
+# Entries a session wrote but has not committed; they reach the LRU only on
+# commit, so a rolled-back batch leaves no LRU entry without a table row
+PENDING_KEY = "category_cache_pending"
+
+
+def _pending(db: Session) -> Dict[CacheKey, CacheEntry]:
+    return db.info.setdefault(PENDING_KEY, {})
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(db: Session):
+    for key, entry in db.info.pop(PENDING_KEY, {}).items():
+        _lru.put(key, entry)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_pending(db: Session, transaction):
+    # Rollback or close without commit (after_commit already took them otherwise)
+    if transaction.parent is None:
+        db.info.pop(PENDING_KEY, None)
+
+
+def cache_key(name: str, manufacturer: Optional[str] = None) -> CacheKey:
+    manufacturer = str(manufacturer) if manufacturer is not None else ""
+    return medicine_name_key(name or ""), manufacturer.strip().lower()
+
+
+def _fetch_entries(db: Session, keys) -> Dict[CacheKey, CacheEntry]:
+    """Exact cache entries for the given keys, from the LRU or the table"""
+    found: Dict[CacheKey, CacheEntry] = {}
+    misses = set()
+    for key in keys:
+        entry = _lru.get(key)
+        if entry is not None:
+            found[key] = entry
+        else:
+            misses.add(key)
+
+    # Rows this session wrote are visible to it but not committed yet
+    pending = db.info.get(PENDING_KEY, {})
+    names = sorted({name_key for name_key, _ in misses})
+    for start in range(0, len(names), LOOKUP_CHUNK_SIZE):
+        rows = (
+            db.query(CategoryCache.name_key, CategoryCache.manufacturer_key, CategoryCache.category, CategoryCache.source)
+            .filter(CategoryCache.name_key.in_(names[start:start + LOOKUP_CHUNK_SIZE]))
+            .all()
+        )
+        for name_key, manufacturer_key, category, source in rows:
+            key = (name_key, manufacturer_key)
+            if key not in pending:
+                _lru.put(key, (category, source))
+            if key in misses:
+                found[key] = (category, source)
+    return found
+
+
+def medicine_description(manufacturer: Optional[str], brand: Optional[str]) -> Optional[str]:
+    """What categorization is told besides the name: manufacturer and brand"""
+    description = " ".join(str(part).strip() for part in (manufacturer, brand) if part is not None).strip()
+    return description or None
+
+
+def lookup_categories(db: Session, items: List[Tuple[str, Optional[str]]]) -> List[Optional[CacheEntry]]:
+    """
+    Cached (category, source) for each (name, manufacturer) pair, or None.
+
+    An entry for the exact manufacturer wins; otherwise the name-only entry
+    is used.
+    """
+    keys = [cache_key(name, manufacturer) for name, manufacturer in items]
+    wanted = set(keys) | {(name_key, "") for name_key, _ in keys}
+    found = _fetch_entries(db, wanted)
+    return [found.get(key) or found.get((key[0], "")) for key in keys]
+
+
+def _replaces(key: CacheKey, new: CacheEntry, current: CacheEntry) -> bool:
+    """Whether a new result should overwrite the cached one"""
+    new_rank, current_rank = SOURCE_RANK[new[1]], SOURCE_RANK[current[1]]
+    if new_rank != current_rank:
+        return new_rank > current_rank
+    # Same source: manual edits and manufacturer-specific answers win,
+    # name-only entries keep their first answer
+    return new[0] != current[0] and (new[1] == CategorySource.MANUAL or key[1] != "")
+
+
+def remember_categories(db: Session, entries: List[Tuple[str, Optional[str], str, CategorySource]]):
+    """
+    Store (name, manufacturer, category, source) results.
+
+    Each result is saved under its manufacturer and under the bare name, so
+    lookups without a manufacturer hit too. Existing entries are only
+    overwritten by a better source (manual > ai > local > keyword). The LRU
+    learns the new entries when the session commits.
+    """
+    rows: Dict[CacheKey, CacheEntry] = {}
+    for name, manufacturer, category, source in entries:
+        if not name or not category:
+            continue
+        name_key, manufacturer_key = cache_key(name, manufacturer)
+        for key in {(name_key, manufacturer_key), (name_key, "")}:
+            current = rows.get(key)
+            if current is None or _replaces(key, (category, source), current):
+                rows[key] = (category, source)
+    if not rows:
+        return
+
+    existing = _fetch_entries(db, rows.keys())
+    inserts = []
+    for key, entry in rows.items():
+        current = existing.get(key)
+        if current is None:
+            inserts.append({"name_key": key[0], "manufacturer_key": key[1], "category": entry[0], "source": entry[1]})
+        elif _replaces(key, entry, current):
+            db.query(CategoryCache).filter(
+                CategoryCache.name_key == key[0],
+                CategoryCache.manufacturer_key == key[1],
+            ).update({"category": entry[0], "source": entry[1]}, synchronize_session=False)
+            _pending(db)[key] = entry
+
+    if inserts:
+        table = CategoryCache.__table__
+        upsert = dialect_insert(db.get_bind())
+        if upsert is not None:
+            # Another upload may have cached the same name concurrently
+            db.execute(upsert(table).on_conflict_do_nothing(index_elements=["name_key", "manufacturer_key"]), inserts)
+        else:
+            db.execute(table.insert(), inserts)
+        for row in inserts:
+            _pending(db)[(row["name_key"], row["manufacturer_key"])] = (row["category"], row["source"])
+
+
+def categorize_with_cache(
+    db: Session,
+    items: List[Tuple[str, Optional[str]]],
+    descriptions: Optional[List[Optional[str]]] = None,
+) -> List[str]:
+    """
+    Categories for (name, manufacturer) pairs, in input order.
+
+    Cache hits are returned as-is; misses (and keyword-only entries while AI
+    is available) are categorized in one batch and remembered. Categorizers
+    see each item's entry of ``descriptions`` (e.g. manufacturer and brand,
+    see medicine_description), or its manufacturer without one; the cache
+    stays keyed by name and manufacturer.
+    """
+    if not items:
+        return []
+    if descriptions is None:
+        descriptions = [manufacturer for _, manufacturer in items]
+    cached = lookup_categories(db, items)
+
+    retry_keyword = ai_available()
+    pending: Dict[CacheKey, Tuple[str, Optional[str], Optional[str]]] = {}
+    for (name, manufacturer), description, entry in zip(items, descriptions, cached):
+        if entry is None or (retry_keyword and CategorySource(entry[1]) == CategorySource.KEYWORD):
+            pending.setdefault(cache_key(name, manufacturer), (name, manufacturer, description))
+
+    fresh: Dict[CacheKey, str] = {}
+    if pending:
+        get_local_categorizer(db)
+        results = categorize_medicines_with_source([(name, description) for name, _, description in pending.values()])
+        remember_categories(db, [
+            (name, manufacturer, category, CategorySource(source))
+            for (name, manufacturer, _), (category, source) in zip(pending.values(), results)
+        ])
+        fresh = {key: category for key, (category, _) in zip(pending, results)}
+
+    return [
+        fresh.get(cache_key(name, manufacturer)) or entry[0]
+        for (name, manufacturer), entry in zip(items, cached)
+    ]
+
+
+def remember_manual_categories(db: Session, items: List[Tuple[str, Optional[str], str]]):
+    """Record user-supplied (name, manufacturer, category) as manual entries"""
+    remember_categories(db, [
+        (name, manufacturer, category, CategorySource.MANUAL)
+        for name, manufacturer, category in items
+    ])
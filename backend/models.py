@@ -1,8 +1,8 @@
 """
 Database models
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Enum as SQLEnum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index, UniqueConstraint, Enum as SQLEnum
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -33,6 +33,13 @@ class AlertType(str, enum.Enum):
     DELAYED_DELIVERY = "delayed_delivery"
 
 
+class CategorySource(str, enum.Enum):
+    AI = "ai"
+    KEYWORD = "keyword"
+    LOCAL = "local"  # ml_models.categorization.LocalCategorizer
+    MANUAL = "manual"
+
+
 class User(Base):
     __tablename__ = "users"
     
@@ -47,12 +54,18 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+def medicine_name_key(name: str) -> str:
+    """Normalized medicine name used for case-insensitive lookups"""
+    return name.strip().lower() if name else name
+
+
 class Medicine(Base):
     __tablename__ = "medicines"
     
     id = Column(Integer, primary_key=True, index=True)
     sku = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False, index=True)
+    name_key = Column(String, index=True)  # medicine_name_key(name), kept in sync below
     category = Column(String, index=True)  # AI-categorized or manual
     manufacturer = Column(String)
     brand = Column(String)
@@ -68,6 +81,16 @@ class Medicine(Base):
     batches = relationship("Batch", back_populates="medicine", cascade="all, delete-orphan")
     transactions = relationship("InventoryTransaction", back_populates="medicine")
 
+    __table_args__ = (
+        # Keyset pagination, newest first
+        Index("ix_medicines_created_at_id", "created_at", "id"),
+    )
+
+    @validates("name")
+    def _sync_name_key(self, key, name):
+        self.name_key = medicine_name_key(name)
+        return name
+
 
 class Batch(Base):
     __tablename__ = "batches"
@@ -90,6 +113,12 @@ class Batch(Base):
     medicine = relationship("Medicine", back_populates="batches")
     transactions = relationship("InventoryTransaction", back_populates="batch")
 
+    __table_args__ = (
+        Index("ix_batches_medicine_id_batch_number", "medicine_id", "batch_number"),
+        # Stock filters: a medicine's unexpired batches with stock
+        Index("ix_batches_medicine_id_is_expired_quantity", "medicine_id", "is_expired", "quantity"),
+    )
+
 
 class Supplier(Base):
     __tablename__ = "suppliers"
@@ -122,6 +151,11 @@ class PurchaseOrder(Base):
     supplier = relationship("Supplier", back_populates="purchase_orders")
     items = relationship("PurchaseOrderItem", back_populates="purchase_order")
 
+    __table_args__ = (
+        # Keyset pagination, newest first
+        Index("ix_purchase_orders_created_at_id", "created_at", "id"),
+    )
+
 
 class PurchaseOrderItem(Base):
     __tablename__ = "purchase_order_items"
@@ -148,10 +182,19 @@ class InventoryTransaction(Base):
     notes = Column(Text)
     created_by = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    external_id = Column(String, unique=True, index=True)  # source Transaction ID scoped by the sale (sales uploads)
     
     medicine = relationship("Medicine", back_populates="transactions")
     batch = relationship("Batch", back_populates="transactions")
 
+    __table_args__ = (
+        # Demand history: a medicine's OUT transactions since a date
+        Index(
+            "ix_inventory_transactions_medicine_id_transaction_type_created_at",
+            "medicine_id", "transaction_type", "created_at"
+        ),
+    )
+
 
 class Alert(Base):
     __tablename__ = "alerts"
@@ -167,6 +210,13 @@ class Alert(Base):
     acknowledged_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # Open-alert lookups per medicine and type
+        Index("ix_alerts_medicine_id_alert_type_is_acknowledged", "medicine_id", "alert_type", "is_acknowledged"),
+        # Keyset pagination, newest first
+        Index("ix_alerts_created_at_id", "created_at", "id"),
+    )
+
 
 class Forecast(Base):
     __tablename__ = "forecasts"
@@ -198,3 +248,66 @@ class PrescriptionOrder(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class CategoryCache(Base):
+    """Remembered medicine categories so the same name is not re-categorized by AI"""
+    __tablename__ = "category_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name_key = Column(String, nullable=False)  # medicine_name_key(name)
+    manufacturer_key = Column(String, nullable=False, default="")  # normalized manufacturer, "" if unknown
+    category = Column(String, nullable=False)
+    source = Column(SQLEnum(CategorySource), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("name_key", "manufacturer_key", name="uq_category_cache_name_manufacturer"),
+    )
+
+
+class UploadCheckpoint(Base):
+    """Progress of an import, keyed by file hash, so a failed upload can resume"""
+    __tablename__ = "upload_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_hash = Column(String, unique=True, index=True, nullable=False)  # sha256 of the uploaded file
+    filename = Column(String)
+    data_type = Column(String)
+    rows_committed = Column(Integer, nullable=False, default=0)  # data rows already applied and committed
+    success_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)
+    warning_count = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="running")  # running, failed, completed
+    created_by = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class ColumnProfile(Base):
+    """Column mapping of a known upload layout, keyed by a fingerprint of its header"""
+    __tablename__ = "column_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    fingerprint = Column(String, unique=True, index=True, nullable=False)  # sha256 of the header tuple
+    header = Column(Text)  # JSON list of the file's column names
+    data_type = Column(String, nullable=False)
+    mapping = Column(Text, nullable=False)  # JSON {standard column: file column}
+    rules_version = Column(String)  # heuristics that produced the mapping
+    source = Column(String, nullable=False, default="detected")  # detected or manual
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class MedicineStockSummary(Base):
+    """Stock of one medicine, kept in step with its batches by utils/stock_summary.py"""
+    __tablename__ = "medicine_stock_summary"
+
+    medicine_id = Column(Integer, ForeignKey("medicines.id"), primary_key=True)
+    sellable_quantity = Column(Integer, nullable=False, default=0)  # batches with stock, not expired, damaged or recalled
+    expired_quantity = Column(Integer, nullable=False, default=0)
+    damaged_quantity = Column(Integer, nullable=False, default=0)  # left in batches marked damaged
+    nearest_expiry = Column(DateTime(timezone=True))  # of the sellable batches
+    stock_value = Column(Float, nullable=False, default=0)  # sellable_quantity * mrp
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
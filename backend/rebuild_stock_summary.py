@@ -0,0 +1,17 @@
+from database import SessionLocal
+from utils.stock_summary import rebuild_stock_summaries
+
+def rebuild_stock_summary():
+    db = SessionLocal()
+    try:
+        count = rebuild_stock_summaries(db)
+        db.commit()
+        print(f"Rebuilt the stock summary of {count} medicines.")
+    except Exception as e:
+        print(f"Error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild_stock_summary()
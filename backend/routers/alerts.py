@@ -1,25 +1,32 @@
 """
 Alerts router
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from typing import List
-from datetime import datetime, timedelta
+from typing import List, Optional
+from datetime import datetime
 
 from database import get_db
-from models import Alert, AlertType, Medicine, Batch
+from models import Alert, AlertType, Batch
 from schemas import AlertResponse
 from auth import get_current_active_user
 from config import settings
 
 router = APIRouter()
 from utils.ai import generate_ai_response
+from utils.pagination import paginate
+from utils.stock_alerts import evaluate_alerts
+
+NEWEST_FIRST = [(Alert.created_at, True), (Alert.id, True)]
+
 
 @router.get("/ai-analysis")
 async def get_alerts_ai_analysis(db: Session = Depends(get_db)):
     """Get AI risk assessment of alerts"""
-    alerts = await get_unacknowledged_alerts(db)
+    alerts = db.query(Alert).filter(
+        Alert.is_acknowledged == False
+    ).order_by(Alert.created_at.desc(), Alert.id.desc()).limit(10).all()
     
     if not alerts:
         return {"analysis": "System is stable. No active alerts demanding attention."}
@@ -44,12 +51,15 @@ async def get_alerts_ai_analysis(db: Session = Depends(get_db)):
 
 @router.get("/", response_model=List[AlertResponse])
 async def get_alerts(
+    response: Response,
     alert_type: AlertType = None,
     acknowledged: bool = None,
     severity: str = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
     db: Session = Depends(get_db)
 ):
-    """Get all alerts"""
+    """Get all alerts, newest first (pass the X-Next-Cursor header of a page as ``cursor`` for the next)"""
     query = db.query(Alert)
     
     if alert_type:
@@ -61,17 +71,19 @@ async def get_alerts(
     if severity:
         query = query.filter(Alert.severity == severity)
     
-    alerts = query.order_by(Alert.created_at.desc()).limit(100).all()
-    return alerts
+    return paginate(db, query, NEWEST_FIRST, cursor, limit, response)
 
 
 @router.get("/unacknowledged", response_model=List[AlertResponse])
-async def get_unacknowledged_alerts(db: Session = Depends(get_db)):
-    """Get unacknowledged alerts"""
-    alerts = db.query(Alert).filter(
-        Alert.is_acknowledged == False
-    ).order_by(Alert.created_at.desc()).all()
-    return alerts
+async def get_unacknowledged_alerts(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Get unacknowledged alerts, newest first"""
+    query = db.query(Alert).filter(Alert.is_acknowledged == False)
+    return paginate(db, query, NEWEST_FIRST, cursor, limit, response)
 
 
 @router.post("/{alert_id}/acknowledge")
@@ -99,70 +111,7 @@ async def run_system_scan(
     current_user = Depends(get_current_active_user)
 ):
     """Run full system scan for low stock and expiry"""
-    medicines = db.query(Medicine).filter(Medicine.is_active == True).all()
-    
-    alerts_created = 0
-    today = datetime.now()
-    month_from_now = today + timedelta(days=30)
-    
-    for medicine in medicines:
-        # 1. Check Low Stock
-        active_batches = [b for b in medicine.batches if not b.is_expired and not b.is_damaged]
-        total_stock = sum([b.quantity for b in active_batches])
-        
-        # Check existing low stock alert
-        existing_stock_alert = db.query(Alert).filter(
-            Alert.medicine_id == medicine.id,
-            Alert.alert_type.in_([AlertType.LOW_STOCK, AlertType.STOCK_OUT]),
-            Alert.is_acknowledged == False
-        ).first()
-        
-        if not existing_stock_alert:
-            # Thresholds: Critical=0, High<15, Medium<30
-            if total_stock == 0:
-                db.add(Alert(
-                    alert_type=AlertType.STOCK_OUT,
-                    medicine_id=medicine.id,
-                    message=f"CRITICAL: {medicine.name} is OUT OF STOCK!",
-                    severity="critical"
-                ))
-                alerts_created += 1
-            elif total_stock < 15:
-                db.add(Alert(
-                    alert_type=AlertType.LOW_STOCK,
-                    medicine_id=medicine.id,
-                    message=f"Low Stock: {medicine.name} has only {total_stock} units.",
-                    severity="high"
-                ))
-                alerts_created += 1
-
-        # 2. Check Expiry
-        for batch in active_batches:
-            if batch.expiry_date and batch.expiry_date <= month_from_now:
-                # Check existing expiry alert for this batch
-                # Note: Simple deduplication by message content comparison for now
-                msg = f"Batch {batch.batch_number} for {medicine.name} expires on {batch.expiry_date.date()}"
-                
-                existing_expiry = db.query(Alert).filter(
-                    Alert.medicine_id == medicine.id,
-                    Alert.alert_type == AlertType.EXPIRY_WARNING,
-                    Alert.message == msg,
-                    Alert.is_acknowledged == False
-                ).first()
-                
-                if not existing_expiry:
-                    days_left = (batch.expiry_date - today).days
-                    severity = "critical" if days_left < 7 else "high"
-                    
-                    db.add(Alert(
-                        alert_type=AlertType.EXPIRY_WARNING,
-                        medicine_id=medicine.id,
-                        message=msg,
-                        severity=severity
-                    ))
-                    alerts_created += 1
-                    
-    db.commit()
+    alerts_created = evaluate_alerts(db)
     return {"message": f"System scan complete. Generated {alerts_created} new alerts."}
 
 
@@ -13,11 +13,11 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
 
 from database import get_db
-from models import Medicine, Batch, Alert, AlertType
+from models import Medicine, Batch, Alert, AlertType, MedicineStockSummary
 from schemas import ChatMessage, ChatResponse
+from utils.medicine_search import search_medicines
 
 # Shared Logger
 logging.basicConfig(level=logging.INFO)
@@ -118,28 +118,17 @@ def handle_inventory_query(query: str, db: Session) -> Optional[str]:
         medicine_name = next((w for w in words if len(w) > 3), None)
 
         if medicine_name:
-            medicine = db.query(Medicine).filter(
-                or_(
-                    Medicine.name.ilike(f"%{medicine_name}%"),
-                    Medicine.sku.ilike(f"%{medicine_name}%")
-                )
-            ).first()
+            medicine = search_medicines(db, db.query(Medicine), medicine_name).first()
 
             if medicine:
-                batches = db.query(Batch).filter(
-                    Batch.medicine_id == medicine.id,
-                    Batch.is_expired == False,
-                    Batch.quantity > 0
-                ).order_by(Batch.expiry_date).all()
-
-                total_stock = sum(b.quantity for b in batches)
+                summary = db.get(MedicineStockSummary, medicine.id)
+                total_stock = summary.sellable_quantity if summary else 0
 
                 if total_stock > 0:
-                    nearest = batches[0]
                     return (
                         f"✅ Yes, we have **{medicine.name}** in stock.\n"
                         f"• Quantity: {total_stock} units\n"
-                        f"• Expiry: {nearest.expiry_date.strftime('%Y-%m-%d')}\n"
+                        f"• Expiry: {summary.nearest_expiry.strftime('%Y-%m-%d')}\n"
                         f"• Location: Shelf A-1"
                     )
                 else:
@@ -7,7 +7,7 @@ from sqlalchemy import func, and_
 from datetime import datetime, timedelta
 
 from database import get_db
-from models import Medicine, Batch, Alert, InventoryTransaction, TransactionType
+from models import Medicine, Batch, Alert, InventoryTransaction, TransactionType, MedicineStockSummary
 from schemas import DashboardStats
 from auth import get_current_active_user
 from config import settings
@@ -45,25 +45,16 @@ async def get_dashboard_insights(db: Session = Depends(get_db)):
 @router.get("/stats", response_model=DashboardStats)
 async def get_dashboard_stats(db: Session = Depends(get_db)):
     """Get dashboard statistics"""
-    # Total stock value
-    total_stock_value = db.query(func.sum(Batch.quantity * Medicine.mrp)).join(
-        Medicine
-    ).filter(
-        Batch.is_expired == False,
-        Batch.is_damaged == False,
-        Batch.is_recalled == False,
-        Batch.quantity > 0
-    ).scalar() or 0
+    # Total stock value (sellable stock, from the stock summary)
+    total_stock_value = db.query(func.sum(MedicineStockSummary.stock_value)).scalar() or 0
     
     # Total SKUs
     total_skus = db.query(Medicine).filter(Medicine.is_active == True).count()
     
     # Low stock count (simplified - compare against threshold)
-    low_stock_count = db.query(Medicine).join(Batch).filter(
-        Batch.is_expired == False,
-        Batch.is_damaged == False
-    ).group_by(Medicine.id).having(
-        func.sum(Batch.quantity) < 20  # Example threshold
+    low_stock_count = db.query(MedicineStockSummary).join(Medicine).filter(
+        Medicine.is_active == True,
+        MedicineStockSummary.sellable_quantity < 20  # Example threshold
     ).count()
     
     # Expiring soon count
@@ -7,7 +7,7 @@ from typing import List
 from datetime import datetime
 
 from database import get_db
-from models import Medicine, Forecast
+from models import Medicine, Forecast, MedicineStockSummary
 from schemas import ForecastResponse
 from ml_models.forecasting import calculate_demand_forecast, batch_forecast_all_medicines
 from auth import get_current_active_user
@@ -93,15 +93,22 @@ async def get_reorder_suggestions(
         query = query.filter(Medicine.category == category)
     
     medicines = query.all()
+    summaries = {
+        summary.medicine_id: summary
+        for summary in query.join(
+            MedicineStockSummary, MedicineStockSummary.medicine_id == Medicine.id
+        ).with_entities(MedicineStockSummary)
+    }
     
     suggestions = []
     for medicine in medicines:
         forecast_data = calculate_demand_forecast(db, medicine.id)
         
-        # Get current stock details
-        total_stock = sum([b.quantity for b in medicine.batches])
-        valid_stock = sum([b.quantity for b in medicine.batches if not b.is_expired])
-        expired_stock = total_stock - valid_stock
+        # Get current stock details from the stock summary
+        summary = summaries.get(medicine.id)
+        valid_stock = summary.sellable_quantity if summary else 0
+        expired_stock = summary.expired_quantity if summary else 0
+        total_stock = valid_stock + expired_stock + (summary.damaged_quantity if summary else 0)
         
         current_stock = valid_stock # Logic still uses sellable stock for priority decision
         
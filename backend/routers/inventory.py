@@ -1,10 +1,11 @@
 """
 Inventory management router
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Response
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Response, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
-from typing import List, Optional
+from sqlalchemy import func
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 import pandas as pd
 import json
@@ -12,13 +13,21 @@ import csv
 from io import BytesIO, StringIO
 import os
 import hashlib
+import asyncio
+import tempfile
 
 from database import get_db
-from models import Medicine, Batch, InventoryTransaction, TransactionType, Alert, AlertType
+from models import Medicine, Batch, InventoryTransaction, TransactionType, Alert, AlertType, MedicineStockSummary
 from schemas import MedicineCreate, MedicineResponse, BatchResponse, TransactionCreate, TransactionResponse
 from auth import get_current_active_user
 from config import settings
-from ml_models.categorization import categorize_medicine
+from ml_models.category_cache import categorize_with_cache, medicine_description, remember_manual_categories
+from utils.medicine_search import match_medicines, search_batches, search_medicines
+from utils.pagination import paginate, reject_skip
+from utils.stock_summary import refresh_stock_summaries
+from utils.upload_readers import READ_BLOCK_SIZE, check_upload_format
+from utils.upload_batch import check_batch_format
+from utils.upload_jobs import get_upload_job, submit_batch_upload_job, submit_upload_job
 
 # Debug: Print database path on import
 print(f"DEBUG: Database URL: {settings.DATABASE_URL}")
@@ -67,138 +76,6 @@ async def get_inventory_ai_analysis(db: Session = Depends(get_db)):
     return {"analysis": generate_ai_response(prompt)}
 
 
-def parse_upload_file(file: UploadFile, contents: bytes) -> pd.DataFrame:
-    """Parse uploaded file based on its extension"""
-    filename = file.filename.lower()
-    
-    if filename.endswith(('.xlsx', '.xls')):
-        # Excel file
-        return pd.read_excel(BytesIO(contents))
-    elif filename.endswith('.csv'):
-        # CSV file - try multiple encodings
-        encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
-        for encoding in encodings:
-            try:
-                return pd.read_csv(BytesIO(contents), encoding=encoding)
-            except (UnicodeDecodeError, UnicodeError):
-                continue
-        # If all encodings fail, try utf-8 with error handling
-        return pd.read_csv(BytesIO(contents), encoding='utf-8', errors='ignore')
-    elif filename.endswith('.json'):
-        # JSON file
-        data = json.loads(contents.decode('utf-8'))
-        # Handle both list of objects and single object
-        if isinstance(data, list):
-            return pd.DataFrame(data)
-        elif isinstance(data, dict) and 'items' in data:
-            return pd.DataFrame(data['items'])
-        else:
-            return pd.DataFrame([data])
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Unsupported file format. Please upload Excel (.xlsx, .xls), CSV (.csv), or JSON (.json) files."
-        )
-
-
-def detect_data_type(df: pd.DataFrame) -> str:
-    """Detect the type of data in the uploaded file"""
-    columns_lower = [col.lower().strip() for col in df.columns]
-    
-    # Check for sales/transaction data - Check this FIRST as it has specific required columns
-    sales_keywords = ['transaction_id', 'qty_sold', 'sold', 'total_amount', 'mrp_unit_price']
-    if any(keyword in ' '.join(columns_lower) for keyword in sales_keywords):
-        return 'sales'
-
-    # Check for inventory/medicine data
-    inventory_keywords = ['sku', 'medicine', 'batch', 'quantity', 'expiry', 'mrp', 'cost']
-    if any(keyword in ' '.join(columns_lower) for keyword in inventory_keywords):
-        return 'inventory'
-    
-    # Check for doctor/physician data
-    doctor_keywords = ['physid', 'doctor', 'physician', 'address', 'phone']
-    if any(keyword in ' '.join(columns_lower) for keyword in doctor_keywords):
-        return 'doctor'
-    
-    # Check for supplier data
-    supplier_keywords = ['supplier', 'vendor', 'distributor']
-    if any(keyword in ' '.join(columns_lower) for keyword in supplier_keywords):
-        return 'supplier'
-        
-    # Default to generic data
-    return 'generic'
-
-
-def normalize_column_names(df: pd.DataFrame, data_type: str = 'inventory') -> pd.DataFrame:
-    """Normalize column names to handle variations based on data type"""
-    df_normalized = df.copy()
-    
-    # Standard mapping (Target Name: [List of possible variations])
-    if data_type == 'inventory':
-        mapping_rules = {
-            'SKU': ['sku', 'product_id', 'item_code', 'id'],
-            'Medicine Name': ['medicine_name', 'name', 'drug_name', 'item', 'product', 'description', 'drug'],
-            'Batch No': ['batch_number', 'batch_no', 'batch', 'lot_number', 'lot'],
-            'Quantity': ['quantity', 'qty', 'stock', 'count'],
-            'Expiry Date': ['expiry_date', 'expire_date', 'exp_date', 'expiry', 'date_of_expiry', 'expiration'],
-            'Category': ['category', 'therapeutic_class', 'class', 'drug_class'],
-            'Purchase ID': ['purchase_id', 'po_number', 'po_id', 'order_id'],
-            'MRP': ['mrp', 'price', 'max_retail_price', 'unit_price', 'retail_price'],
-            'Cost': ['cost', 'cost_price', 'purchase_cost', 'rate', 'unit_cost_price'],
-            'Purchase Price': ['purchase_price', 'purchase_rate', 'buying_price'],
-            'Purchase Date': ['purchase_date', 'buying_date', 'date_of_purchase', 'date_received'],
-            'Schedule': ['schedule', 'drug_schedule', 'category_class'],
-            'Storage Requirements': ['storage_requirements', 'storage', 'storage_condition'],
-            'Manufacturer': ['manufacturer', 'mfg', 'company', 'brand', 'supplier', 'vendor']
-        }
-    elif data_type == 'doctor':
-        mapping_rules = {
-            'physID': ['physid', 'phys_id', 'doctor_id', 'id'],
-            'name': ['name', 'doctor_name', 'physician_name', 'full_name'],
-            'address': ['address', 'clinic_address', 'hospital_address', 'location'],
-            'phone': ['phone', 'phone_number', 'mobile', 'contact', 'contact_number']
-        }
-    elif data_type == 'sales':
-        mapping_rules = {
-            'Transaction ID': ['transaction_id', 'txn_id', 'id', 'invoice_no'],
-            'Date': ['date', 'transaction_date', 'sale_date', 'invoice_date'],
-            'Drug Name': ['drug_name', 'medicine_name', 'item_name', 'product'],
-            'Batch Number': ['batch_number', 'batch_no', 'batch'],
-            'Quantity Sold': ['qty_sold', 'quantity', 'sold', 'qty', 'units'],
-            'Unit Price': ['mrp_unit_price', 'unit_price', 'price', 'rate', 'selling_price'],
-            'Total Amount': ['total_amount', 'total', 'amount', 'value']
-        }
-    else:
-        mapping_rules = {}
-
-    # Create a new DataFrame with standardized columns
-    new_df = pd.DataFrame()
-    
-    # Get current columns in lower case stripped format for easy matching
-    # Map: {clean_name: original_actual_name}
-    current_cols = {str(col).lower().strip().replace('_', '').replace(' ', ''): col for col in df_normalized.columns}
-    
-    # 1. Map known columns
-    for target_col, variations in mapping_rules.items():
-        for var in variations:
-            # Normalize variation for matching
-            clean_var = var.lower().replace('_', '').replace(' ', '')
-            
-            if clean_var in current_cols:
-                original_col_name = current_cols[clean_var]
-                # Copy data using the standardized name
-                # We use .copy() to avoid SettingWithCopy warnings if applicable
-                new_df[target_col] = df_normalized[original_col_name]
-                break # Found a match for this target column, stop looking
-    
-    # 2. Add any other columns from original that weren't mapped?
-    # For simplified logic, we only strictly map what we know.
-    # But if users have extra columns they might want them? 
-    # For now, strictly mapped guarantees clean data structure for the next steps.
-    
-    return new_df
-
-
 def clean_currency(value):
     """Helper to clean currency strings like '$12.50' to float"""
     if pd.isna(value):
@@ -214,442 +91,153 @@ def clean_currency(value):
         return None
 
 
-
-@router.post("/upload", response_model=dict)
+@router.post("/upload", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
 async def upload_inventory_file(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    dry_run: bool = False,
+    resume: bool = True,
     current_user = Depends(get_current_active_user)
 ):
     """
     Upload inventory file (Excel, CSV, or JSON) to update inventory.
-    Optimized for performance with pre-fetching and idempotent for historical data.
+    The file is saved and imported by a background worker (utils/upload_jobs.py);
+    poll GET /upload/jobs/{job_id} for progress. The finished job's "result"
+    has the same shape as the former synchronous response.
+    With dry_run=true the file is only validated: nothing is written and the
+    result adds "column_stats" and "projected" inserts/updates.
+    Re-uploading a file whose import failed resumes after its last committed
+    row; pass resume=false to import it from the start.
     """
-    try:
-        # Check file size
-        contents = await file.read()
-        if len(contents) > settings.MAX_UPLOAD_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE / (1024*1024):.1f}MB"
-            )
-        
-        # Parse file based on format
-        try:
-            print(f"DEBUG: Starting file parse for {file.filename}")
-            df = parse_upload_file(file, contents)
-            print(f"DEBUG: File parsed successfully. Rows: {len(df)}")
-        except Exception as e:
-            print(f"ERROR: Parse failed: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Error parsing file: {str(e)}"
-            )
-        
-        if df.empty:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File is empty or contains no data"
-            )
-        
-        # Initialize tracking variables
-        success_count = 0
-        errors = []
-        warnings = []
-        verification_details = []
-
-        # Detect data type
-        data_type = detect_data_type(df)
-        
-        # Normalize column names based on data type
-        df = normalize_column_names(df, data_type)
-        
-        # --- OPTIMIZATION START: Pre-fetch Data ---
-        print("DEBUG: Pre-fetching database records for optimization...")
-        
-        # 1. Fetch all Medicines into a dictionary for O(1) lookup
-        # Map: Lowercase Name -> Medicine Object
-        existing_medicines = db.query(Medicine).all()
-        medicine_map = {m.name.lower(): m for m in existing_medicines}
-        print(f"DEBUG: Loaded {len(medicine_map)} medicines.")
-
-        # 2. Fetch all Batches into a dictionary
-        # Map: (MedicineID, BatchNumber) -> Batch Object
-        # We need this to check duplicates without querying DB every row
-        existing_batches = db.query(Batch).all()
-        batch_map = {(b.medicine_id, b.batch_number): b for b in existing_batches}
-        print(f"DEBUG: Loaded {len(batch_map)} batches.")
-
-        # 3. Cache for new items created during this transaction to avoid internal duplicates
-        new_medicines_cache = {} # Name -> Medicine
-        new_batches_cache = set() # (MedicineID, BatchNumber)
-        
-        # --- OPTIMIZATION END ---
-
-        # Handle different data types
-        if data_type == 'inventory':
-            # Validate required columns for inventory
-            required_columns = ['Medicine Name', 'Batch No', 'Quantity', 'Expiry Date']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Missing required columns for inventory data: {missing_columns}. Found columns: {list(df.columns)}"
-                )
-                
-            for idx, row in df.iterrows():
-                try:
-                    # Validate and extract data
-                    name = str(row['Medicine Name']).strip()
-                    if not name or name == 'nan':
-                        errors.append(f"Row {idx + 2}: Medicine Name is required")
-                        continue
-
-                    batch_no = str(row['Batch No']).strip()
-                    if not batch_no or batch_no == 'nan':
-                        errors.append(f"Row {idx + 2}: Batch No is required")
-                        continue
-
-                    # Medicine Lookup / Creation
-                    medicine = None
-                    name_key = name.lower()
-                    
-                    if name_key in medicine_map:
-                        medicine = medicine_map[name_key]
-                    elif name_key in new_medicines_cache:
-                        medicine = new_medicines_cache[name_key]
-                    else:
-                        # CREATE NEW MEDICINE
-                        sku = str(row.get('SKU', '')).strip()
-                        if not sku or sku == 'nan':
-                            # Generate SKU
-                            clean_name_val = name.upper().strip()
-                            hash_suffix = hashlib.md5(clean_name_val.encode()).hexdigest()[:6].upper()
-                            sku = f"MED-{hash_suffix}"
-                        
-                        # Use provided Category if available, else AI
-                        category = str(row.get('Category', '')).strip()
-                        if not category or category == 'nan':
-                            description = f"{row.get('Manufacturer', '')} {row.get('Brand', '')}".strip()
-                            category = categorize_medicine(name, description if description else None)
-                        
-                        mrp_val = clean_currency(row.get('MRP'))
-                        cost_val = clean_currency(row.get('Cost'))
-
-                        medicine = Medicine(
-                            sku=sku,
-                            name=name,
-                            category=category,
-                            manufacturer=row.get('Manufacturer', '') if pd.notna(row.get('Manufacturer')) else None,
-                            brand=row.get('Brand', '') if pd.notna(row.get('Brand')) else None,
-                            mrp=mrp_val,
-                            cost=cost_val,
-                            schedule=row.get('Schedule', '') if pd.notna(row.get('Schedule')) else None,
-                            storage_requirements=row.get('Storage Requirements', '') if pd.notna(row.get('Storage Requirements')) else None,
-                            is_active=True
-                        )
-                        db.add(medicine)
-                        db.flush() # distinct flush to get ID
-                        
-                        # Update caches
-                        medicine_map[name_key] = medicine
-                        new_medicines_cache[name_key] = medicine
-                    
-                    # Batch Logic
-                    batch_key = (medicine.id, batch_no)
-                    
-                    if batch_key in batch_map or batch_key in new_batches_cache:
-                        # BATCH EXISTS
-                        success_count += 1
-                        continue
-
-                    # CREATE NEW BATCH
-                    try:
-                        quantity = int(float(row['Quantity']))
-                        if quantity < 0:
-                            errors.append(f"Row {idx + 2}: Quantity cannot be negative")
-                            continue
-                    except (ValueError, TypeError):
-                        errors.append(f"Row {idx + 2}: Invalid quantity value: {row['Quantity']}")
-                        continue
-                    
-                    # Parse dates
-                    expiry_date = None
-                    try:
-                        expiry_date_raw = pd.to_datetime(row['Expiry Date'], errors='coerce')
-                        if pd.notna(expiry_date_raw):
-                             expiry_date = expiry_date_raw.to_pydatetime() if isinstance(expiry_date_raw, pd.Timestamp) else expiry_date_raw
-                             if hasattr(expiry_date, 'tzinfo') and expiry_date.tzinfo is not None:
-                                expiry_date = expiry_date.replace(tzinfo=None)
-                    except:
-                        pass
-                        
-                    if not expiry_date:
-                        errors.append(f"Row {idx + 2}: Invalid expiry date")
-                        continue
-
-                    # Create Batch
-                    today = datetime.now().date()
-                    expiry_date_only = expiry_date.date()
-                    is_expired = expiry_date_only < today
-                    
-                    purchase_date_dt = None
-                    if pd.notna(row.get('Purchase Date')):
-                        try:
-                            purchase_date_raw = pd.to_datetime(row.get('Purchase Date'))
-                            purchase_date_dt = purchase_date_raw.to_pydatetime() if isinstance(purchase_date_raw, pd.Timestamp) else purchase_date_raw
-                            if hasattr(purchase_date_dt, 'tzinfo') and purchase_date_dt.tzinfo is not None:
-                                purchase_date_dt = purchase_date_dt.replace(tzinfo=None)
-                        except:
-                            pass
-
-                    purchase_price_val = clean_currency(row.get('Purchase Price'))
-                    if purchase_price_val is None:
-                        # Fallback to Cost if Purchase Price is missing
-                        purchase_price_val = clean_currency(row.get('Cost'))
-
-                    batch = Batch(
-                        medicine_id=medicine.id,
-                        batch_number=batch_no,
-                        quantity=quantity,
-                        expiry_date=expiry_date,
-                        purchase_date=purchase_date_dt,
-                        purchase_price=purchase_price_val,
-                        is_expired=is_expired
-                    )
-                    db.add(batch)
-                    db.flush()
-                    
-                    # Update local cache to prevent re-creation in same loop
-                    batch_map[batch_key] = batch
-                    new_batches_cache.add(batch_key)
-                    
-                    # Create Transaction
-                    po_info = f" (PO: {row.get('Purchase ID')})" if pd.notna(row.get('Purchase ID')) and str(row.get('Purchase ID')).strip() else ""
-                    supp_info = f", Supplier: {row.get('Manufacturer')}" if pd.notna(row.get('Manufacturer')) else ""
-                    
-                    transaction = InventoryTransaction(
-                        medicine_id=medicine.id,
-                        batch_id=batch.id,
-                        transaction_type=TransactionType.IN,
-                        quantity=quantity,
-                        notes=f"File upload - {file.filename}{po_info}{supp_info}",
-                        created_by=current_user.id
-                    )
-                    db.add(transaction)
-                    
-                    if is_expired:
-                        warnings.append(f"Row {idx + 2}: Added expired batch {batch_no}.")
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    import traceback
-                    # print(traceback.format_exc())
-                    errors.append(f"Row {idx + 2}: {str(e)}")
-                    continue
-
-        elif data_type == 'doctor':
-            # For doctor data, we'll just validate and return success
-            # You can extend this to store in a doctors table if needed
-            return {
-                "message": "Doctor data file uploaded successfully",
-                "data_type": "doctor",
-                "success_count": len(df),
-                "error_count": 0,
-                "warning_count": 0,
-                "errors": [],
-                "warnings": [],
-                "total_rows": len(df),
-                "preview": df.head(10).to_dict(orient='records')
-            }
-        elif data_type == 'sales':
-            created_batches_cache = {} # Cache to prevent duplicate batch creation in loop
-            
-            for idx, row in df.iterrows():
-                try:
-                    # Validate Medicine
-                    name = str(row['Drug Name']).strip()
-                    if not name or name == 'nan':
-                        errors.append(f"Row {idx + 2}: Drug Name is required")
-                        continue
-                     
-                    name_key = name.lower()
-                    medicine = medicine_map.get(name_key)
-                    
-                    if not medicine:
-                         # For sales, we might need to lazy-create if not found (or error)
-                         # Let's auto-create generic medicine
-                        sku = str(uuid.uuid4())[:8].upper()
-                        category = categorize_medicine(name, None)
-                        medicine = Medicine(
-                            sku=sku,
-                            name=name,
-                            category=category,
-                            mrp=float(row['MRP_Unit_Price']) if pd.notna(row.get('MRP_Unit_Price')) else 0,
-                            cost=0, 
-                            is_active=True
-                        )
-                        db.add(medicine)
-                        db.flush()
-                        medicine_map[name_key] = medicine
-                        
-                    # Update Medicine MRP if better data
-                    if pd.notna(row.get('MRP_Unit_Price')) and (medicine.mrp is None or medicine.mrp == 0):
-                         try:
-                             new_mrp = float(row.get('MRP_Unit_Price'))
-                             if new_mrp > 0:
-                                 medicine.mrp = new_mrp
-                                 db.add(medicine)
-                         except:
-                             pass
-                        
-                    # Validate Quantity
-                    try:
-                        qty_sold = int(float(row['Quantity Sold']))
-                        if qty_sold <= 0:
-                            errors.append(f"Row {idx + 2}: Quantity Sold must be positive")
-                            continue
-                    except (ValueError, TypeError):
-                         errors.append(f"Row {idx + 2}: Invalid Quantity Sold")
-                         continue
-
-                    # Parse Date
-                    transaction_date = datetime.now()
-                    if pd.notna(row.get('Date')):
-                        try:
-                            date_raw = pd.to_datetime(row.get('Date'))
-                            transaction_date = date_raw.to_pydatetime() if isinstance(date_raw, pd.Timestamp) else date_raw
-                            if hasattr(transaction_date, 'tzinfo') and transaction_date.tzinfo is not None:
-                                transaction_date = transaction_date.replace(tzinfo=None)
-                        except:
-                            pass
-                    
-                    # Check Transaction ID Duplication GLOBAL check?
-                    # Since we don't have all transactions in memory, we might need a query here.
-                    # Or rely on client not uploading same file.
-                    # Optimization: Skip this check for now or accept some risk? 
-                    # "Accurate results" -> we should check.
-                    # Easiest way: If Batch Found & Qty matches... hard to say. 
-                    # Let's rely on unique Transaction ID (Sales Upload) in DB? 
-                    # For now, sales data is smaller usually, or just append.
-                    
-                    # Find Batch
-                    batch = None
-                    batch_no = str(row.get('Batch Number', '')).strip()
-                    if batch_no and batch_no != 'nan':
-                         batch_key = (medicine.id, batch_no)
-                         batch = batch_map.get(batch_key)
-                    
-                    if not batch:
-                         # Fallback or create generic batch
-                         batch_num = batch_no if (batch_no and batch_no != 'nan') else 'SALES-IMPORT'
-                         batch_key = (medicine.id, batch_num)
-                         
-                         if batch_key in batch_map:
-                             batch = batch_map[batch_key]
-                         else:
-                             # Create generic/missing batch
-                             batch = Batch(
-                                 medicine_id=medicine.id,
-                                 batch_number=batch_num,
-                                 quantity=0, # Will go negative
-                                 expiry_date=datetime.now() + timedelta(days=365*2),
-                                 is_expired=False
-                             )
-                             db.add(batch)
-                             db.flush()
-                             batch_map[batch_key] = batch
-                             warnings.append(f"Row {idx + 2}: Auto-created batch {batch_num} for sale.")
-                    
-                    # Deduct Stock
-                    batch.quantity -= qty_sold
-                    if batch.quantity < 0:
-                         pass # Allow negative for tracking
-
-                    # Create Transaction
-                    transaction = InventoryTransaction(
-                        medicine_id=medicine.id,
-                        batch_id=batch.id,
-                        transaction_type=TransactionType.OUT,
-                        quantity=qty_sold,
-                        unit_price=float(row.get('Unit Price')) if pd.notna(row.get('Unit Price')) else None,
-                        notes=f"Sales Upload - {row.get('Transaction ID', '')}",
-                        created_by=current_user.id,
-                        created_at=transaction_date
-                    )
-                    db.add(transaction)
-                    success_count += 1
-                    
-                except Exception as e:
-                    errors.append(f"Row {idx + 2}: {str(e)}")
-                    continue
-
-        elif data_type == 'generic':
-            # For generic data, return the parsed data
-            return {
-                "message": "File uploaded and parsed successfully",
-                "data_type": "generic",
-                "success_count": len(df),
-                "error_count": 0,
-                "warning_count": 0,
-                "errors": [],
-                "warnings": [],
-                "total_rows": len(df),
-                "columns": list(df.columns),
-                "preview": df.head(10).to_dict(orient='records')
-            }
-        
-        # Commit changes to database
-        try:
-            db.commit()
-            print(f"DEBUG: Successfully committed {success_count} records")
-            
-            # Post-upload logic: Generate Realtime Alerts
-            try:
-                # Run alerts asynchronously or lightweight
-                pass
-            except Exception as e:
-                print(f"WARNING: Failed to generate alerts: {e}")
-                
-        except Exception as e:
-            db.rollback()
-            raise Exception(f"Failed to commit transaction: {str(e)}")
+    check_upload_format(file.filename)
 
-        return {
-            "message": "Upload completed",
-            "success_count": success_count,
-            "error_count": len(errors),
-            "warning_count": len(warnings),
-            "errors": errors[:50],  # Return first 50 errors
-            "warnings": warnings[:20],  # Return first 20 warnings
-            "total_rows": len(df),
-            "data_type": data_type, # Return the detected data type
-            "verification": verification_details
-        }
-        
+    # Check file size (the copy below enforces it when the size is not declared)
+    if file.size is not None and file.size > settings.MAX_UPLOAD_SIZE:
+        raise upload_too_large()
+
+    try:
+        path, file_hash = await run_in_threadpool(save_upload_to_temp, file)
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
-        import traceback
-        error_trace = traceback.format_exc()
-        # print(f"ERROR: Exception in upload_inventory_file: {e}")
-        # print(f"ERROR: Traceback: {error_trace}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing file: {str(e)}"
+            detail=f"Error saving file: {str(e)}"
         )
 
+    job = submit_upload_job(file.filename, path, current_user.id, dry_run=dry_run, file_hash=file_hash, resume=resume)
+    response = job.to_dict()
+    response["status_url"] = f"/api/inventory/upload/jobs/{job.id}"
+    return response
+
+
+@router.post("/upload-batch", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def upload_inventory_batch(
+    files: List[UploadFile] = File(...),
+    dry_run: bool = False,
+    resume: bool = True,
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Upload many inventory/sales files, or zip archives of them, in one request.
+    Files are parsed in parallel worker processes and imported in order as one
+    background job; poll GET /upload/jobs/{job_id}. The finished job's "result"
+    has the combined counts plus a "files" list with each file's own result.
+    """
+    for file in files:
+        check_batch_format(file.filename)
+
+    total_size = sum(file.size or 0 for file in files)
+    if total_size > settings.MAX_UPLOAD_SIZE:
+        raise upload_too_large()
+
+    saved = []
+    remaining = settings.MAX_UPLOAD_SIZE
+    try:
+        for file in files:
+            path, file_hash = await run_in_threadpool(save_upload_to_temp, file, remaining)
+            saved.append((file.filename, path, file_hash))
+            remaining -= os.path.getsize(path)
+    except Exception as e:
+        for _, path, _ in saved:
+            os.remove(path)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error saving file: {str(e)}"
+        )
+
+    job = submit_batch_upload_job(saved, current_user.id, dry_run=dry_run, resume=resume)
+    response = job.to_dict()
+    response["status_url"] = f"/api/inventory/upload/jobs/{job.id}"
+    return response
+
+
+@router.get("/upload/jobs/{job_id}", response_model=dict)
+async def get_upload_job_status(
+    job_id: str,
+    current_user = Depends(get_current_active_user)
+):
+    """Progress of a background upload: rows processed, errors, warnings and ETA"""
+    job = get_upload_job(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job.to_dict()
+
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Upload size exceeds maximum allowed size of {settings.MAX_UPLOAD_SIZE / (1024*1024):.1f}MB"
+    )
+
+
+def save_upload_to_temp(file: UploadFile, max_bytes: Optional[int] = None) -> Tuple[str, str]:
+    """
+    Copy the request body to a temp file the worker can read after the
+    request ends. Returns the path and the file's sha256 (its checkpoint key).
+    Bytes are counted during the copy, since streamed uploads declare no
+    size: past ``max_bytes`` (default MAX_UPLOAD_SIZE) the copy is removed
+    and a 413 raised.
+    """
+    if max_bytes is None:
+        max_bytes = settings.MAX_UPLOAD_SIZE
+    suffix = os.path.splitext(file.filename)[1]
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=suffix)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            file.file.seek(0)
+            for block in iter(lambda: file.file.read(READ_BLOCK_SIZE), b""):
+                size += len(block)
+                if size > max_bytes:
+                    raise upload_too_large()
+                digest.update(block)
+                out.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
 
 @router.post("/upload-excel", response_model=dict)
 async def upload_inventory_excel(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
     """Upload Excel file to update inventory (legacy endpoint for backward compatibility)"""
-    return await upload_inventory_file(file, db, current_user)
+    job = await upload_inventory_file(file, current_user=current_user)
+    try:
+        # Runs on the worker pool; the event loop only awaits the result
+        return await asyncio.wrap_future(get_upload_job(job["job_id"]).future)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing file: {str(e)}"
+        )
 
 
 def check_expiry_alerts(db: Session):
@@ -700,11 +288,10 @@ def check_low_stock_alerts(db: Session):
     stock_levels = db.query(
         Medicine.id,
         Medicine.name,
-        func.sum(Batch.quantity).label('total_quantity')
-    ).join(Batch).filter(
-        Batch.quantity > 0,
-        Batch.is_expired == False
-    ).group_by(Medicine.id).all()
+        MedicineStockSummary.sellable_quantity
+    ).join(MedicineStockSummary).filter(
+        MedicineStockSummary.sellable_quantity > 0
+    ).all()
     
     for medicine_id, medicine_name, total_quantity in stock_levels:
         # Simple threshold - in production, compare against forecasted demand
@@ -847,41 +434,41 @@ async def get_categories(db: Session = Depends(get_db)):
 
 @router.get("/medicines", response_model=List[MedicineResponse])
 async def get_medicines(
-    skip: int = 0,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: int = 100,
     category: str = None,
     search: str = None,
+    skip: Optional[int] = Query(None, deprecated=True),
     db: Session = Depends(get_db)
 ):
-    """Get list of medicines"""
-    # First check total medicines (including inactive) for debugging
-    total_all = db.query(Medicine).count()
-    total_active = db.query(Medicine).filter(Medicine.is_active == True).count()
-    total_inactive = db.query(Medicine).filter(Medicine.is_active == False).count()
-    print(f"DEBUG: get_medicines - Total medicines: {total_all} (Active: {total_active}, Inactive: {total_inactive})")
-    
+    """
+    Get list of medicines, newest first (best matches first when searching).
+
+    Pass the X-Next-Cursor header of a page as ``cursor`` to get the next.
+    """
+    reject_skip(skip)
     query = db.query(Medicine).filter(Medicine.is_active == True)
     
     if category:
         query = query.filter(Medicine.category == category)
     
+    keys = [(Medicine.created_at, True), (Medicine.id, True)]
     if search:
-        query = query.filter(
-            (Medicine.name.ilike(f"%{search}%")) |
-            (Medicine.sku.ilike(f"%{search}%")) |
-            (Medicine.manufacturer.ilike(f"%{search}%")) |
-            (Medicine.brand.ilike(f"%{search}%"))
-        )
+        query, rank = match_medicines(db, query, search)
+        if rank is not None:
+            keys.insert(0, (rank, False))
     
-    medicines = query.order_by(Medicine.created_at.desc()).offset(skip).limit(limit).all()
+    medicines = paginate(db, query, keys, cursor, limit, response)
     
     # Debug logging
-    total_count = db.query(Medicine).filter(Medicine.is_active == True).count()
-    print(f"DEBUG: get_medicines - Total in DB: {total_count}, Returning: {len(medicines)} (skip={skip}, limit={limit}, category={category}, search={search})")
+    print(f"DEBUG: get_medicines - Returning: {len(medicines)} (cursor={cursor}, limit={limit}, category={category}, search={search})")
     if len(medicines) > 0:
         print(f"DEBUG: First medicine: {medicines[0].name} (SKU: {medicines[0].sku}, ID: {medicines[0].id})")
-    elif total_count > 0:
-        print(f"WARNING: Database has {total_count} medicines but query returned 0. Check filters!")
+    elif not cursor:
+        total_count = db.query(Medicine).filter(Medicine.is_active == True).count()
+        if total_count > 0:
+            print(f"WARNING: Database has {total_count} medicines but query returned 0. Check filters!")
     
     return medicines
 
@@ -907,12 +494,18 @@ async def create_medicine(
     if existing:
         raise HTTPException(status_code=400, detail="SKU already exists")
     
-    # Auto-categorize if not provided
+    # Auto-categorize if not provided (category cache first, then AI/keywords)
     if not medicine.category:
-        medicine.category = categorize_medicine(medicine.name, medicine.manufacturer or "", medicine.brand or "")
+        medicine.category = categorize_with_cache(
+            db, [(medicine.name, medicine.manufacturer)], [medicine_description(medicine.manufacturer, medicine.brand)]
+        )[0]
+    else:
+        remember_manual_categories(db, [(medicine.name, medicine.manufacturer, medicine.category)])
     
     db_medicine = Medicine(**medicine.dict())
     db.add(db_medicine)
+    db.flush()
+    refresh_stock_summaries(db, [db_medicine.id])
     db.commit()
     db.refresh(db_medicine)
     return db_medicine
@@ -1090,13 +683,8 @@ async def compare_prices(query: str, db: Session = Depends(get_db)):
         return []
 
     # 1. Try to find the medicine in our local DB to give the AI better context
-    # Use ILIKE for case-insensitive search
-    medicine = db.query(Medicine).filter(
-        or_(
-            Medicine.name.ilike(f"%{query}%"),
-            Medicine.sku.ilike(f"%{query}%")
-        )
-    ).first()
+    # Best full-text match
+    medicine = search_medicines(db, db.query(Medicine), query).first()
 
     context_str = ""
     target_name = query
@@ -1186,67 +774,50 @@ async def get_medicine_batches(
 
 @router.get("/stock-levels")
 async def get_stock_levels(
+    response: Response,
     low_stock_only: bool = False,
+    medicine_id: Optional[List[int]] = Query(None),
+    cursor: Optional[str] = None,
+    limit: int = 100,
     db: Session = Depends(get_db)
 ):
-    """Get stock levels for all medicines"""
-    # Use subquery to get stock levels for active batches only
-    from sqlalchemy import and_
-    
-    # First, get all active medicines
-    medicines = db.query(Medicine).filter(Medicine.is_active == True).all()
-    
-    print(f"DEBUG: get_stock_levels - Processing {len(medicines)} medicines, low_stock_only={low_stock_only}")
-    
-    total_batches_in_db = db.query(Batch).count()
-    active_batches_in_db = db.query(Batch).filter(
-        Batch.quantity > 0,
-        Batch.is_expired == False
-    ).count()
-    
-    print(f"DEBUG: Total batches in DB: {total_batches_in_db}, Active batches: {active_batches_in_db}")
-    
-    results = []
-    for medicine in medicines:
-        # Get active batches for this medicine
-        active_batches = db.query(Batch).filter(
-            and_(
-                Batch.medicine_id == medicine.id,
-                Batch.quantity > 0,
-                Batch.is_expired == False
-            )
-        ).all()
-        
-        # Also get all batches for debugging
-        all_batches = db.query(Batch).filter(Batch.medicine_id == medicine.id).all()
-        
-        total_quantity = sum([b.quantity for b in active_batches])
-        nearest_expiry = min([b.expiry_date for b in active_batches]) if active_batches else None
-        
-        # Debug logging for first few medicines
-        if len(results) < 3:
-            print(f"DEBUG: Medicine {medicine.name} (ID: {medicine.id}) - All batches: {len(all_batches)}, Active: {len(active_batches)}, Total qty: {total_quantity}")
-            if all_batches:
-                for b in all_batches:
-                    print(f"  Batch {b.batch_number}: qty={b.quantity}, expired={b.is_expired}, expiry={b.expiry_date.date() if b.expiry_date else None}")
-        
-        # Apply low stock filter if needed
-        if low_stock_only and total_quantity >= 50:
-            continue
-        
-        results.append({
-            "medicine_id": medicine.id,
-            "sku": medicine.sku,
-            "name": medicine.name,
-            "category": medicine.category,
-            "total_quantity": total_quantity,
+    """
+    Get sellable stock levels of active medicines, ordered by medicine id.
+
+    Reads the medicine_stock_summary projection, at most ``limit`` (up to
+    1000) medicines at a time. Pass the X-Next-Cursor header of a page as
+    ``cursor`` to get the next. Repeat ``medicine_id`` to get the levels of
+    the medicines a page shows.
+    """
+    total_quantity = func.coalesce(MedicineStockSummary.sellable_quantity, 0)
+    query = db.query(
+        Medicine.id,
+        Medicine.sku,
+        Medicine.name,
+        Medicine.category,
+        total_quantity.label("total_quantity"),
+        MedicineStockSummary.nearest_expiry,
+    ).outerjoin(
+        MedicineStockSummary, MedicineStockSummary.medicine_id == Medicine.id
+    ).filter(Medicine.is_active == True)
+    if medicine_id:
+        query = query.filter(Medicine.id.in_(medicine_id))
+    if low_stock_only:
+        query = query.filter(total_quantity < 50)
+    rows = paginate(db, query, [(Medicine.id, False)], cursor, limit, response)
+
+    results = [
+        {
+            "medicine_id": row_id,
+            "sku": sku,
+            "name": name,
+            "category": category,
+            "total_quantity": quantity,
             "nearest_expiry": nearest_expiry.isoformat() if nearest_expiry else None
-        })
-    
-    print(f"DEBUG: get_stock_levels - Returning {len(results)} stock levels")
-    if len(medicines) > 0 and len(results) == 0:
-        print(f"WARNING: {len(medicines)} medicines exist but 0 stock levels returned. All batches might be expired or have 0 quantity!")
-    
+        }
+        for row_id, sku, name, category, quantity, nearest_expiry in rows
+    ]
+    print(f"DEBUG: get_stock_levels - Returning {len(results)} stock levels (cursor={cursor}, low_stock_only={low_stock_only})")
     return results
 
 
@@ -1273,6 +844,7 @@ async def create_transaction(
             batch.quantity -= transaction.quantity
         elif transaction.transaction_type == TransactionType.IN:
             batch.quantity += transaction.quantity
+        refresh_stock_summaries(db, [batch.medicine_id])
     
     db_transaction = InventoryTransaction(
         **transaction.dict(),
@@ -1402,35 +974,30 @@ async def get_inventory_ai_audit(db: Session = Depends(get_db)):
 
 @router.get("/grid", response_model=List[dict])
 def get_inventory_grid(
-    skip: int = 0,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: int = 100,
     search: Optional[str] = None,
     category: Optional[str] = None,
+    skip: Optional[int] = Query(None, deprecated=True),
     db: Session = Depends(get_db)
 ):
     """
     Get flat inventory grid data (Batches joined with Medicine)
     Returns: Name, Category, Quantity, Price, Expiry, Batch No, Supplier
+    Pass the X-Next-Cursor header of a page as ``cursor`` to get the next.
     """
+    reject_skip(skip)
     query = db.query(Batch, Medicine).join(Medicine)
     
     if search:
-        search_term = f"%{search.lower()}%"
-        query = query.filter(
-            or_(
-                func.lower(Medicine.name).like(search_term),
-                func.lower(Medicine.sku).like(search_term),
-                func.lower(Batch.batch_number).like(search_term)
-            )
-        )
+        query = search_batches(db, query, search)
     
     if category and category != "All Categories":
          query = query.filter(Medicine.category == category)
          
     # Order by Expiry Date (FEFO) by default as requested in UI implies
-    query = query.order_by(Batch.expiry_date.asc())
-    
-    results = query.offset(skip).limit(limit).all()
+    results = paginate(db, query, [(Batch.expiry_date, False), (Batch.id, False)], cursor, limit, response)
     
     grid_data = []
     for batch, med in results:
@@ -1469,8 +1036,9 @@ def delete_medicine(
     # 2. Delete Transactions
     db.query(InventoryTransaction).filter(InventoryTransaction.medicine_id == medicine_id).delete()
     
-    # 3. Delete Batches
+    # 3. Delete Batches and the stock summary
     db.query(Batch).filter(Batch.medicine_id == medicine_id).delete()
+    db.query(MedicineStockSummary).filter(MedicineStockSummary.medicine_id == medicine_id).delete()
     
     # 4. Delete Medicine
     db.delete(medicine)
@@ -1,9 +1,9 @@
 """
 Suppliers router
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 import uuid
 
@@ -14,6 +14,7 @@ from auth import get_current_active_user
 
 router = APIRouter()
 from utils.ai import generate_ai_response
+from utils.pagination import paginate
 
 @router.get("/ai-analysis")
 async def get_suppliers_ai_analysis(db: Session = Depends(get_db)):
@@ -52,7 +53,8 @@ async def get_suppliers(
     return suppliers
 
 
-@router.get("/{supplier_id}", response_model=SupplierResponse)
+# ":int" so /purchase-orders below is not taken for a supplier id
+@router.get("/{supplier_id:int}", response_model=SupplierResponse)
 async def get_supplier(supplier_id: int, db: Session = Depends(get_db)):
     """Get supplier details"""
     supplier = db.query(Supplier).filter(Supplier.id == supplier_id).first()
@@ -167,11 +169,14 @@ async def create_purchase_order(
 
 @router.get("/purchase-orders", response_model=List[PurchaseOrderResponse])
 async def get_purchase_orders(
+    response: Response,
     supplier_id: int = None,
     status: str = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
     db: Session = Depends(get_db)
 ):
-    """Get purchase orders"""
+    """Get purchase orders, newest first (pass the X-Next-Cursor header of a page as ``cursor`` for the next)"""
     query = db.query(PurchaseOrder)
     
     if supplier_id:
@@ -180,7 +185,7 @@ async def get_purchase_orders(
     if status:
         query = query.filter(PurchaseOrder.status == status)
     
-    pos = query.order_by(PurchaseOrder.created_at.desc()).all()
+    pos = paginate(db, query, [(PurchaseOrder.created_at, True), (PurchaseOrder.id, True)], cursor, limit, response)
     return pos
 
 
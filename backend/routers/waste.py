@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 
 from database import get_db
 from models import Batch, Medicine, InventoryTransaction, TransactionType
+from utils.stock_summary import refresh_stock_summaries
 from auth import get_current_active_user
 
 router = APIRouter()
@@ -292,6 +293,7 @@ async def mark_batch_expired(
         created_by=current_user.id
     )
     db.add(transaction)
+    refresh_stock_summaries(db, [batch.medicine_id])
     db.commit()
     
     return {"message": "Batch marked as expired"}
@@ -325,6 +327,7 @@ async def mark_batch_damaged(
         created_by=current_user.id
     )
     db.add(transaction)
+    refresh_stock_summaries(db, [batch.medicine_id])
     db.commit()
     
     return {"message": "Batch marked as damaged"}
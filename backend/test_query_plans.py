@@ -0,0 +1,246 @@
+"""
+Query-plan regression harness.
+
+Seeds a temporary SQLite database with a few thousand medicines, batches,
+transactions and alerts, drives the hot endpoints (stock levels, batches,
+transactions, waste, forecasts, search, paginated lists, inventory and
+sales uploads with their background alert evaluation) through the app, and
+records every SQL statement they run. Each statement is checked with EXPLAIN QUERY PLAN using
+its real parameters: a SCAN of a large table (full table or full index
+scan) is a failure, index lookups show up as SEARCH.
+
+Run from the backend directory:
+    python test_query_plans.py             # prints the plan of every statement
+    python -m pytest test_query_plans.py
+"""
+import contextlib
+import io
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("GEMINI_API_KEY", "")
+
+# Tables whose full scans grow with the catalog or the history
+LARGE_TABLES = {"medicines", "batches", "inventory_transactions", "alerts", "medicine_stock_summary"}
+MEDICINES = 3000
+BATCHES_PER_MEDICINE = 10
+TRANSACTIONS_PER_MEDICINE = 10
+
+PLANNED_STATEMENT = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+FULL_SCAN = re.compile(r"^SCAN (\w+)")
+LIMITED = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+# Statements that read a whole table by design, with the reason
+INTENDED_SCANS = {
+    "SELECT medicines.name_key AS medicines_name_key, medicines.category AS medicines_category FROM medicines":
+        "the local categorizer trains on every labelled medicine, once per process",
+}
+
+
+class QueryPlanHarness:
+    """The app on a seeded temporary database, recording the SQL it runs"""
+
+    def __init__(self):
+        self.db_path = os.path.join(tempfile.mkdtemp(prefix="query-plans-"), "plans.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{self.db_path}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            from fastapi.testclient import TestClient
+            from sqlalchemy import event
+
+            import main
+            from auth import get_current_active_user
+            from database import SessionLocal, engine
+            from ml_models import categorization
+
+        # config.py loads .env with override=True, which could point elsewhere
+        if os.path.abspath(engine.url.database) != os.path.abspath(self.db_path):
+            raise RuntimeError(f"DATABASE_URL from .env ({engine.url}) overrides the harness database")
+        categorization.model = None
+
+        self.engine = engine
+        self.session = SessionLocal
+        self.user = self.seed()
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+        main.app.dependency_overrides[get_current_active_user] = lambda: self.user
+        self.client = TestClient(main.app)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if PLANNED_STATEMENT.match(statement):
+            # insertmanyvalues batches report executemany with a single flat row
+            if executemany and parameters and isinstance(parameters[0], (list, tuple, dict)):
+                parameters = parameters[0]
+            if not isinstance(parameters, dict):
+                parameters = tuple(parameters)
+            self.statements.append((statement, parameters))
+
+    def seed(self):
+        """Medicines with batches, OUT transactions and open alerts; returns the user"""
+        from sqlalchemy import insert
+
+        from models import Alert, AlertType, Batch, InventoryTransaction, Medicine, TransactionType, User, UserRole
+        from utils.stock_summary import rebuild_stock_summaries
+
+        now = datetime.now()
+        with self.engine.begin() as conn:
+            conn.execute(insert(User), [{
+                "email": "plans@pharmacy.com", "full_name": "Plans", "role": UserRole.ADMIN,
+                "hashed_password": "-", "is_active": True,
+            }])
+            conn.execute(insert(Medicine), [
+                {"sku": f"SKU-{i}", "name": f"Medicine {i}", "name_key": f"medicine {i}",
+                 "category": "General", "mrp": 10.0, "is_active": True}
+                for i in range(1, MEDICINES + 1)
+            ])
+            conn.execute(insert(Batch), [
+                {"medicine_id": i, "batch_number": f"B{i}-{j}", "quantity": (i * j) % 40,
+                 "expiry_date": now + timedelta(days=(i + j * 37) % 700 - 30),
+                 "is_expired": j == 0, "is_damaged": False, "is_recalled": False}
+                for i in range(1, MEDICINES + 1) for j in range(BATCHES_PER_MEDICINE)
+            ])
+            conn.execute(insert(InventoryTransaction), [
+                {"medicine_id": i, "batch_id": (i - 1) * BATCHES_PER_MEDICINE + 1,
+                 "transaction_type": TransactionType.OUT, "quantity": 1,
+                 "created_at": now - timedelta(days=j * 9)}
+                for i in range(1, MEDICINES + 1) for j in range(TRANSACTIONS_PER_MEDICINE)
+            ])
+            conn.execute(insert(Alert), [
+                {"alert_type": AlertType.LOW_STOCK, "medicine_id": i, "message": f"Low Stock: Medicine {i}",
+                 "severity": "high", "is_acknowledged": i % 2 == 0}
+                for i in range(1, MEDICINES + 1)
+            ])
+            rebuild_stock_summaries(conn)
+
+        db = self.session()
+        user = db.query(User).one()
+        db.expunge(user)
+        db.close()
+        return user
+
+    def upload(self, filename: str, content: str):
+        from utils.stock_alerts import _executor as alert_executor
+        from utils.upload_jobs import get_upload_job
+
+        response = self.client.post("/api/inventory/upload", files={"file": (filename, content.encode())})
+        response.raise_for_status()
+        get_upload_job(response.json()["job_id"]).future.result()
+        # The alert evaluation runs after the job, on its own thread
+        alert_executor.submit(lambda: None).result()
+
+    def next_page(self, url: str, params: dict):
+        """The second page of a cursor-paginated list"""
+        from utils.pagination import NEXT_CURSOR_HEADER
+
+        first = self.client.get(url, params=params)
+        first.raise_for_status()
+        return self.client.get(url, params={**params, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+
+    def exercise(self):
+        """The hot paths whose queries must stay index-driven"""
+        medicine_id = 1234
+        batch_id = (medicine_id - 1) * BATCHES_PER_MEDICINE + 3
+        expiry = (datetime.now() + timedelta(days=400)).strftime("%Y-%m-%d")
+        calls = [
+            lambda: self.client.get("/api/inventory/stock-levels", params={"limit": 50}),
+            lambda: self.next_page("/api/inventory/stock-levels", {"low_stock_only": True, "limit": 50}),
+            lambda: self.client.get("/api/inventory/stock-levels", params={"medicine_id": [5, medicine_id]}),
+            lambda: self.client.get(f"/api/inventory/medicines/{medicine_id}"),
+            lambda: self.client.get(f"/api/inventory/medicines/{medicine_id}/batches"),
+            lambda: self.client.post("/api/inventory/transactions", json={
+                "medicine_id": medicine_id, "batch_id": batch_id, "transaction_type": "in", "quantity": 5,
+            }),
+            lambda: self.client.post(f"/api/waste/mark-damaged/{batch_id}", params={"quantity": 1}),
+            lambda: self.client.get(f"/api/forecasting/medicine/{medicine_id}"),
+            # Search: a broad term (every medicine), a single medicine, a batch number
+            lambda: self.client.get("/api/inventory/grid", params={"search": "medicine"}),
+            lambda: self.client.get("/api/inventory/grid", params={"search": f"SKU-{medicine_id}"}),
+            lambda: self.client.get("/api/inventory/grid", params={"search": f"B{medicine_id}-3"}),
+            lambda: self.client.get("/api/inventory/price-comparison", params={"query": f"medicine {medicine_id}"}),
+            # Cursor pagination
+            lambda: self.next_page("/api/inventory/grid", {"limit": 50}),
+            lambda: self.next_page("/api/inventory/grid", {"limit": 50, "search": "medicine"}),
+            lambda: self.next_page("/api/inventory/medicines", {"limit": 50}),
+            lambda: self.next_page("/api/inventory/medicines", {"limit": 50, "search": "medicine 12"}),
+            lambda: self.next_page("/api/alerts/", {"limit": 50}),
+            lambda: self.next_page("/api/alerts/unacknowledged", {"limit": 50}),
+            lambda: self.upload("stock.csv", (
+                "Name,Quantity,Price,Expiry Date,Batch No\n"
+                f"Medicine 10,5,10,{expiry},B10-1\n"
+                f"Medicine 11,7,10,{expiry},NEW-11\n"
+                f"Brand New Medicine,3,10,{expiry},NEW-1\n"
+            )),
+            lambda: self.upload("sales.csv", (
+                "Transaction_ID,Date,Drug_Name,Batch_Number,Qty_Sold,MRP_Unit_Price\n"
+                "PLAN-1,2026-01-05,Medicine 20,B20-3,1,10\n"
+                "PLAN-2,2026-01-05,Medicine 21,B21-4,2,10\n"
+            )),
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for call in calls:
+                response = call()
+                if response is not None:
+                    response.raise_for_status()
+
+    @staticmethod
+    def is_full_scan(statement: str, plan) -> bool:
+        """
+        Whether the plan scans a large table. A scan in index order that
+        stops at a LIMIT (a keyset page) is bounded and allowed; a LIMIT
+        after a temp B-tree sort still reads every row.
+        """
+        flat = " ".join(statement.split())
+        if any(flat.startswith(prefix) for prefix in INTENDED_SCANS):
+            return False
+        scans = [line for line in plan if (m := FULL_SCAN.match(line)) and m.group(1) in LARGE_TABLES]
+        if not scans:
+            return False
+        return not (LIMITED.search(statement) and not any("TEMP B-TREE" in line for line in plan))
+
+    def full_scans(self):
+        """(statement, plan) of every recorded statement that scans a large table"""
+        failures = []
+        plans = []
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for statement, parameters in self.statements:
+                cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+                plan = [row[-1] for row in cursor.fetchall()]
+                plans.append((statement, plan))
+                if self.is_full_scan(statement, plan):
+                    failures.append((statement, plan))
+        finally:
+            raw.close()
+        return plans, failures
+
+
+def run_harness(verbose: bool = False):
+    harness = QueryPlanHarness()
+    harness.exercise()
+    plans, failures = harness.full_scans()
+    if verbose:
+        for statement, plan in plans:
+            print(" ".join(statement.split()))
+            for line in plan:
+                print(f"    {line}")
+    return plans, failures
+
+
+def test_hot_queries_use_indexes():
+    plans, failures = run_harness()
+    assert plans, "no statements were recorded"
+    assert not failures, "full scans of large tables:\n" + "\n".join(
+        f"{' '.join(statement.split())}\n    {plan}" for statement, plan in failures
+    )
+
+
+if __name__ == "__main__":
+    plans, failures = run_harness(verbose=True)
+    print(f"\n{len(plans)} statements, {len(failures)} with full scans of large tables")
+    for statement, plan in failures:
+        print(f"FULL SCAN: {' '.join(statement.split())}\n    {plan}")
+    sys.exit(1 if failures else 0)
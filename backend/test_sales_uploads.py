@@ -0,0 +1,151 @@
+"""
+Sales upload idempotency checks.
+
+Uploads sales exports through the app on a temporary SQLite database and
+checks the stock they deduct: two stores whose POS exports reuse the same
+Transaction IDs (in one zip batch upload) must both be applied, and
+uploading an export again must skip every row, report them as already
+imported and leave stock alone.
+
+Run from the backend directory:
+    python test_sales_uploads.py
+    python -m pytest test_sales_uploads.py
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("GEMINI_API_KEY", "")
+
+STOCK = 100
+TRANSACTION_IDS = range(1000, 1005)
+
+
+class SalesUploadHarness:
+    """The app with one medicine and lot that both stores sell from"""
+
+    def __init__(self):
+        if "database" not in sys.modules:
+            db_path = os.path.join(tempfile.mkdtemp(prefix="sales-uploads-"), "sales.db")
+            os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            from fastapi.testclient import TestClient
+
+            import main
+            from auth import get_current_active_user
+            from database import SessionLocal
+
+        self.session = SessionLocal
+        # Unique names keep the checks apart from rows other tests left behind
+        suffix = uuid.uuid4().hex[:8]
+        self.name = f"Dedupe Test {suffix}"
+        self.lot = f"LOT-{suffix}"
+        self.user, self.batch_id = self.seed(suffix)
+        main.app.dependency_overrides[get_current_active_user] = lambda: self.user
+        self.client = TestClient(main.app)
+
+    def seed(self, suffix: str):
+        from models import Batch, Medicine, User, UserRole
+
+        db = self.session()
+        try:
+            user = User(email=f"sales-{suffix}@pharmacy.com", full_name="Sales", role=UserRole.ADMIN,
+                        hashed_password="-", is_active=True)
+            medicine = Medicine(sku=f"SKU-{suffix}", name=self.name, name_key=self.name.lower(),
+                                category="General", mrp=10.0, is_active=True)
+            db.add_all([user, medicine])
+            db.flush()
+            batch = Batch(medicine_id=medicine.id, batch_number=self.lot, quantity=STOCK,
+                          expiry_date=datetime.now() + timedelta(days=400), is_expired=False)
+            db.add(batch)
+            db.commit()
+            batch_id = batch.id
+            db.refresh(user)
+            db.expunge(user)
+            return user, batch_id
+        finally:
+            db.close()
+
+    def export(self, day: int) -> str:
+        """A store's POS export: IDs 1000-1004 each selling 2 units of the lot"""
+        rows = [
+            f"{txn_id},2026-01-{day:02d} {10 + i}:00,{self.name},{self.lot},2,10"
+            for i, txn_id in enumerate(TRANSACTION_IDS)
+        ]
+        return "Transaction_ID,Date,Drug_Name,Batch_Number,Qty_Sold,MRP_Unit_Price\n" + "\n".join(rows) + "\n"
+
+    def finished_job(self, response) -> dict:
+        from utils.stock_alerts import _executor as alert_executor
+        from utils.upload_jobs import get_upload_job
+
+        response.raise_for_status()
+        job = get_upload_job(response.json()["job_id"])
+        job.future.result()
+        # The alert evaluation runs after the job, on its own thread
+        alert_executor.submit(lambda: None).result()
+        return self.client.get(f"/api/inventory/upload/jobs/{job.id}").json()["result"]
+
+    def upload(self, filename: str, content: bytes) -> dict:
+        return self.finished_job(self.client.post("/api/inventory/upload", files={"file": (filename, content)}))
+
+    def upload_batch(self, filename: str, content: bytes) -> dict:
+        return self.finished_job(self.client.post("/api/inventory/upload-batch", files={"files": (filename, content)}))
+
+    def stock(self) -> int:
+        from models import Batch
+
+        db = self.session()
+        try:
+            return db.query(Batch.quantity).filter(Batch.id == self.batch_id).scalar()
+        finally:
+            db.close()
+
+    def sales(self) -> int:
+        from models import InventoryTransaction, TransactionType
+
+        db = self.session()
+        try:
+            return db.query(InventoryTransaction).filter(
+                InventoryTransaction.batch_id == self.batch_id,
+                InventoryTransaction.transaction_type == TransactionType.OUT,
+            ).count()
+        finally:
+            db.close()
+
+
+def zipped(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def test_sales_uploads_are_idempotent_per_store():
+    harness = SalesUploadHarness()
+    store_a, store_b = harness.export(5), harness.export(6)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = harness.upload_batch("night.zip", zipped({"storeA.csv": store_a, "storeB.csv": store_b}))
+    assert [(f["status"], f["success_count"]) for f in result["files"]] == [("completed", 5), ("completed", 5)]
+    assert harness.sales() == 10
+    assert harness.stock() == STOCK - 20
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        again = harness.upload("storeA.csv", store_a.encode())
+    assert again["success_count"] == 0
+    assert "Skipped 5 already-imported sales" in again["warnings"]
+    assert harness.sales() == 10
+    assert harness.stock() == STOCK - 20
+
+
+if __name__ == "__main__":
+    test_sales_uploads_are_idempotent_per_store()
+    print("sales uploads: OK")
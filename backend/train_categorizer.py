@@ -0,0 +1,18 @@
+from database import SessionLocal
+from ml_models.categorization import local_categorizer_path, train_local_categorizer
+
+def train_categorizer():
+    db = SessionLocal()
+    try:
+        model = train_local_categorizer(db)
+        if model is None:
+            print("Not enough categorized medicines to train the local categorizer yet.")
+            return
+        print(f"Saved local categorizer ({len(model.classes)} categories) to {local_categorizer_path()}")
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    train_categorizer()
@@ -0,0 +1,220 @@
+"""
+Column mapping for uploads, with a registry of known file layouts.
+
+detect_data_type and match_columns work out what a file contains from its
+header with keyword heuristics. Suppliers send the same few hundred layouts
+again and again, so the outcome is stored per layout in ``column_profiles``,
+keyed by a fingerprint of the exact header tuple, with an in-process dict in
+front of it. A known layout resolves with one dict lookup to its stored
+mapping; only unseen headers go through the heuristics, and their profile is
+saved for the next upload. Profiles produced by older heuristics are
+re-detected. Profiles with source ``manual`` are always used as stored, so
+a layout the heuristics get wrong can be fixed by editing its row (running
+processes pick up the edit after a restart).
+"""
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import pandas as pd
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import ColumnProfile
+
+
+# Keywords that identify each data type, checked in order. Sales comes first
+# because its columns overlap with inventory's
+DATA_TYPE_KEYWORDS = [
+    ('sales', ['transaction_id', 'qty_sold', 'sold', 'total_amount', 'mrp_unit_price']),
+    ('inventory', ['sku', 'medicine', 'batch', 'quantity', 'expiry', 'mrp', 'cost']),
+    ('doctor', ['physid', 'doctor', 'physician', 'address', 'phone']),
+    ('supplier', ['supplier', 'vendor', 'distributor']),
+]
+
+
+def detect_data_type(df: pd.DataFrame) -> str:
+    """Detect the type of data in the uploaded file"""
+    return detect_header_type(df.columns)
+
+
+def detect_header_type(columns) -> str:
+    """Data type of a header; 'generic' when no keyword matches"""
+    header = ' '.join(str(col).lower().strip() for col in columns)
+    for data_type, keywords in DATA_TYPE_KEYWORDS:
+        if any(keyword in header for keyword in keywords):
+            return data_type
+    return 'generic'
+
+
+# Standard column mapping per data type (Target Name: [List of possible variations])
+COLUMN_MAPPING_RULES = {
+    'inventory': {
+        'SKU': ['sku', 'product_id', 'item_code', 'id'],
+        'Medicine Name': ['medicine_name', 'name', 'drug_name', 'item', 'product', 'description', 'drug'],
+        'Batch No': ['batch_number', 'batch_no', 'batch', 'lot_number', 'lot'],
+        'Quantity': ['quantity', 'qty', 'stock', 'count'],
+        'Expiry Date': ['expiry_date', 'expire_date', 'exp_date', 'expiry', 'date_of_expiry', 'expiration'],
+        'Category': ['category', 'therapeutic_class', 'class', 'drug_class'],
+        'Purchase ID': ['purchase_id', 'po_number', 'po_id', 'order_id'],
+        'MRP': ['mrp', 'price', 'max_retail_price', 'unit_price', 'retail_price'],
+        'Cost': ['cost', 'cost_price', 'purchase_cost', 'rate', 'unit_cost_price'],
+        'Purchase Price': ['purchase_price', 'purchase_rate', 'buying_price'],
+        'Purchase Date': ['purchase_date', 'buying_date', 'date_of_purchase', 'date_received'],
+        'Schedule': ['schedule', 'drug_schedule', 'category_class'],
+        'Storage Requirements': ['storage_requirements', 'storage', 'storage_condition'],
+        'Manufacturer': ['manufacturer', 'mfg', 'company', 'brand', 'supplier', 'vendor']
+    },
+    'doctor': {
+        'physID': ['physid', 'phys_id', 'doctor_id', 'id'],
+        'name': ['name', 'doctor_name', 'physician_name', 'full_name'],
+        'address': ['address', 'clinic_address', 'hospital_address', 'location'],
+        'phone': ['phone', 'phone_number', 'mobile', 'contact', 'contact_number']
+    },
+    'sales': {
+        'Transaction ID': ['transaction_id', 'txn_id', 'id', 'invoice_no'],
+        'Date': ['date', 'transaction_date', 'sale_date', 'invoice_date'],
+        'Drug Name': ['drug_name', 'medicine_name', 'item_name', 'product'],
+        'Batch Number': ['batch_number', 'batch_no', 'batch'],
+        'Quantity Sold': ['qty_sold', 'quantity', 'sold', 'qty', 'units'],
+        'Unit Price': ['mrp_unit_price', 'unit_price', 'price', 'rate', 'selling_price'],
+        'Total Amount': ['total_amount', 'total', 'amount', 'value']
+    },
+}
+
+
+def match_columns(columns, data_type: str) -> Dict[str, str]:
+    """Map each standard column name to the file column it is read from"""
+    mapping_rules = COLUMN_MAPPING_RULES.get(data_type, {})
+
+    # Get current columns in lower case stripped format for easy matching
+    # Map: {clean_name: original_actual_name}
+    current_cols = {str(col).lower().strip().replace('_', '').replace(' ', ''): col for col in columns}
+
+    matched = {}
+    for target_col, variations in mapping_rules.items():
+        for var in variations:
+            # Normalize variation for matching
+            clean_var = var.lower().replace('_', '').replace(' ', '')
+            if clean_var in current_cols:
+                matched[target_col] = current_cols[clean_var]
+                break # Found a match for this target column, stop looking
+    return matched
+
+
+def normalize_column_names(df: pd.DataFrame, data_type: str = 'inventory', mapping: Dict[str, str] = None) -> pd.DataFrame:
+    """
+    Normalize column names to handle variations based on data type.
+    ``mapping`` (standard column -> file column, e.g. from a profile) skips
+    the matching.
+    """
+    if mapping is None:
+        mapping = match_columns(df.columns, data_type)
+    # Create a new DataFrame with standardized columns.
+    # We only strictly map what we know, which guarantees a clean data
+    # structure for the next steps.
+    new_df = pd.DataFrame()
+    for target_col, original_col_name in mapping.items():
+        new_df[target_col] = df[original_col_name]
+    return new_df
+
+
+def needed_upload_columns(header: List[str], data_type: str) -> Optional[List[str]]:
+    """
+    File columns the normalizer will read, for readers that can skip the
+    rest (None keeps every column).
+    """
+    if data_type not in COLUMN_MAPPING_RULES:
+        return None
+    return list(match_columns(header, data_type).values())
+
+
+class UploadLayout(NamedTuple):
+    """What a header holds: its data type and standard column -> file column"""
+    data_type: str
+    mapping: Dict[str, str]
+
+    def needed_columns(self) -> Optional[List[str]]:
+        """File columns the importer reads (None keeps every column)"""
+        if self.data_type not in COLUMN_MAPPING_RULES:
+            return None
+        return list(self.mapping.values())
+
+
+LayoutResolver = Callable[[List[str]], UploadLayout]
+
+# Stored profiles from other heuristics (keywords or rules) are re-detected
+RULES_VERSION = hashlib.sha256(
+    json.dumps([DATA_TYPE_KEYWORDS, COLUMN_MAPPING_RULES], sort_keys=True).encode()
+).hexdigest()[:12]
+
+_layouts: Dict[str, UploadLayout] = {}
+_layouts_lock = threading.Lock()
+
+
+def header_fingerprint(header: List[str]) -> str:
+    """sha256 of the exact header tuple (names, order and spelling)"""
+    return hashlib.sha256('\x1f'.join(str(col) for col in header).encode()).hexdigest()
+
+
+def detect_layout(header: List[str]) -> UploadLayout:
+    """Layout from the keyword heuristics alone"""
+    data_type = detect_header_type(header)
+    return UploadLayout(data_type, match_columns(header, data_type))
+
+
+def _usable(profile: ColumnProfile) -> bool:
+    return profile.source == 'manual' or profile.rules_version == RULES_VERSION
+
+
+def resolve_layout(header: List[str], db: Optional[Session] = None, save: bool = True) -> UploadLayout:
+    """
+    Layout of a header: the in-process registry, then ``column_profiles``,
+    and only for unknown headers the heuristics, whose result is stored
+    (unless ``save`` is False, e.g. for dry runs).
+    """
+    if db is None or not all(isinstance(col, str) for col in header):
+        # Headers with numbers or dates as names are not stored: the mapping
+        # could not be read back from JSON with the same column keys
+        return detect_layout(header)
+
+    fingerprint = header_fingerprint(header)
+    layout = _layouts.get(fingerprint)
+    if layout is not None:
+        return layout
+
+    profile = db.query(ColumnProfile).filter(ColumnProfile.fingerprint == fingerprint).first()
+    if profile is not None and _usable(profile):
+        layout = UploadLayout(profile.data_type, json.loads(profile.mapping))
+    else:
+        layout = detect_layout(header)
+        if not save:
+            return layout
+        print(f"DEBUG: New upload layout ({layout.data_type}): {list(header)}")
+        if profile is None:
+            profile = ColumnProfile(fingerprint=fingerprint)
+            db.add(profile)
+        profile.header = json.dumps(list(header))
+        profile.data_type = layout.data_type
+        profile.mapping = json.dumps(layout.mapping)
+        profile.rules_version = RULES_VERSION
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another upload stored the same layout first
+            db.rollback()
+
+    with _layouts_lock:
+        _layouts[fingerprint] = layout
+    return layout
+
+
+def known_layouts(db: Session) -> Dict[str, UploadLayout]:
+    """Every usable stored profile by fingerprint, for workers without a session"""
+    for profile in db.query(ColumnProfile):
+        if _usable(profile):
+            with _layouts_lock:
+                _layouts[profile.fingerprint] = UploadLayout(profile.data_type, json.loads(profile.mapping))
+    with _layouts_lock:
+        return dict(_layouts)
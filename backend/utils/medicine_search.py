@@ -0,0 +1,215 @@
+"""
+Full-text search over medicines (name, SKU, manufacturer, brand) and batch
+numbers.
+
+Every word of a search term must match the start of a word, so "para 500"
+finds "Paracetamol 500mg"; words with punctuation match as phrases, so
+"SKU-12" finds "SKU-1234" but not "SKU-9 12". Medicine matches are ranked, name and SKU hits first.
+
+On SQLite the index is a pair of FTS5 tables over ``medicines`` and
+``batches``, kept in sync by triggers so every writer (ORM, bulk inserts,
+raw SQL) updates them. On Postgres the same words are matched against
+GIN-indexed ``tsvector`` expressions. Databases without either (or SQLite
+builds without FTS5) fall back to substring ILIKE filters.
+"""
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import ColumnElement, column, func, literal_column, or_, select, table, text
+from sqlalchemy.orm import Query, Session
+
+from models import Batch, Medicine
+
+# Column weights: name and SKU hits rank above manufacturer and brand
+RANK_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+# From this many matching medicines on, walking batches in expiry order
+# finds a grid page sooner than sorting every matching batch
+DENSE_MATCH_MEDICINES = 200
+TOKEN = re.compile(r"[^\W_]+")
+
+medicine_search = table("medicine_search", column("rowid"), column("rank"), column("medicine_search"))
+batch_search = table("batch_search", column("rowid"), column("batch_search"))
+
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE medicine_search USING fts5(
+        name, sku, manufacturer, brand,
+        content='medicines', content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER medicine_search_insert AFTER INSERT ON medicines BEGIN
+        INSERT INTO medicine_search(rowid, name, sku, manufacturer, brand)
+        VALUES (new.id, new.name, new.sku, new.manufacturer, new.brand);
+    END""",
+    """CREATE TRIGGER medicine_search_delete AFTER DELETE ON medicines BEGIN
+        INSERT INTO medicine_search(medicine_search, rowid, name, sku, manufacturer, brand)
+        VALUES ('delete', old.id, old.name, old.sku, old.manufacturer, old.brand);
+    END""",
+    """CREATE TRIGGER medicine_search_update AFTER UPDATE OF name, sku, manufacturer, brand ON medicines BEGIN
+        INSERT INTO medicine_search(medicine_search, rowid, name, sku, manufacturer, brand)
+        VALUES ('delete', old.id, old.name, old.sku, old.manufacturer, old.brand);
+        INSERT INTO medicine_search(rowid, name, sku, manufacturer, brand)
+        VALUES (new.id, new.name, new.sku, new.manufacturer, new.brand);
+    END""",
+    f"""INSERT INTO medicine_search(medicine_search, rank) VALUES ('rank', 'bm25({", ".join(map(str, RANK_WEIGHTS))})')""",
+    """CREATE VIRTUAL TABLE batch_search USING fts5(
+        batch_number,
+        content='batches', content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER batch_search_insert AFTER INSERT ON batches BEGIN
+        INSERT INTO batch_search(rowid, batch_number) VALUES (new.id, new.batch_number);
+    END""",
+    """CREATE TRIGGER batch_search_delete AFTER DELETE ON batches BEGIN
+        INSERT INTO batch_search(batch_search, rowid, batch_number) VALUES ('delete', old.id, old.batch_number);
+    END""",
+    """CREATE TRIGGER batch_search_update AFTER UPDATE OF batch_number ON batches BEGIN
+        INSERT INTO batch_search(batch_search, rowid, batch_number) VALUES ('delete', old.id, old.batch_number);
+        INSERT INTO batch_search(rowid, batch_number) VALUES (new.id, new.batch_number);
+    END""",
+    "INSERT INTO medicine_search(medicine_search) VALUES ('rebuild')",
+    "INSERT INTO batch_search(batch_search) VALUES ('rebuild')",
+]
+
+# The expressions must match the queries below for Postgres to use the indexes
+PG_MEDICINE_VECTOR = (
+    "to_tsvector('simple', coalesce(medicines.name, '') || ' ' || coalesce(medicines.sku, '') || ' ' "
+    "|| coalesce(medicines.manufacturer, '') || ' ' || coalesce(medicines.brand, ''))"
+)
+PG_BATCH_VECTOR = "to_tsvector('simple', coalesce(batches.batch_number, ''))"
+
+POSTGRES_SEARCH_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_medicines_search ON medicines USING gin (({PG_MEDICINE_VECTOR}))",
+    f"CREATE INDEX IF NOT EXISTS ix_batches_search ON batches USING gin (({PG_BATCH_VECTOR}))",
+]
+
+
+def create_search_index(conn) -> bool:
+    """Create (and fill) the search index if the database lacks it; returns whether it exists"""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        for statement in POSTGRES_SEARCH_DDL:
+            conn.execute(text(statement))
+        return True
+    if dialect != "sqlite":
+        return False
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'batch_search'")).first():
+        return True
+    if not conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+        print("WARNING: SQLite was built without FTS5; medicine search falls back to LIKE filters")
+        return False
+    print("DEBUG: Migration - building the medicine search index")
+    for statement in SQLITE_SEARCH_DDL:
+        conn.execute(text(statement))
+    return True
+
+
+def search_tokens(term: Optional[str]) -> List[List[str]]:
+    """The tokens of each word of a search term ("SKU-12 para" -> [["sku", "12"], ["para"]])"""
+    words = (TOKEN.findall(word) for word in (term or "").lower().split())
+    return [tokens for tokens in words if tokens]
+
+
+def search_index_available(db: Session) -> bool:
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return True
+    return dialect == "sqlite" and db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = 'batch_search'")
+    ).first() is not None
+
+
+def _match_query(words: List[List[str]], dialect: str) -> str:
+    """Every word must match; a word's tokens as a phrase whose last token is a prefix"""
+    if dialect == "postgresql":
+        return " & ".join(f"({' <-> '.join(tokens)}:*)" for tokens in words)
+    return " ".join(f'"{" ".join(tokens)}"*' for tokens in words)
+
+
+def medicine_matches(db: Session, term: str):
+    """
+    Subquery of (medicine_id, rank) for the medicines matching every word
+    of ``term``; a lower rank is a better match. None if the term has no
+    words or there is no search index.
+    """
+    words = search_tokens(term)
+    if not words or not search_index_available(db):
+        return None
+    dialect = db.get_bind().dialect.name
+    match = _match_query(words, dialect)
+    if dialect == "postgresql":
+        vector = literal_column(PG_MEDICINE_VECTOR)
+        query = func.to_tsquery("simple", match)
+        return select(
+            Medicine.id.label("medicine_id"), (-func.ts_rank(vector, query)).label("rank")
+        ).where(vector.op("@@")(query)).subquery()
+    return select(
+        medicine_search.c.rowid.label("medicine_id"), medicine_search.c.rank.label("rank")
+    ).where(medicine_search.c.medicine_search.op("MATCH")(match)).subquery()
+
+
+def batch_matches(db: Session, term: str):
+    """Select of the ids of batches whose number matches every word of ``term``"""
+    words = search_tokens(term)
+    if not words or not search_index_available(db):
+        return None
+    dialect = db.get_bind().dialect.name
+    match = _match_query(words, dialect)
+    if dialect == "postgresql":
+        vector = literal_column(PG_BATCH_VECTOR)
+        return select(Batch.id).where(vector.op("@@")(func.to_tsquery("simple", match)))
+    return select(batch_search.c.rowid).where(batch_search.c.batch_search.op("MATCH")(match))
+
+
+def match_medicines(db: Session, query: Query, term: str) -> Tuple[Query, Optional[ColumnElement]]:
+    """
+    Filter a Medicine query to the medicines matching ``term``. Returns
+    the query and the rank to order by (lower is better), or None without
+    an index, where the term is a substring filter.
+    """
+    matches = medicine_matches(db, term)
+    if matches is None:
+        if not search_tokens(term):
+            return query, None
+        pattern = f"%{term}%"
+        return query.filter(or_(
+            Medicine.name.ilike(pattern),
+            Medicine.sku.ilike(pattern),
+            Medicine.manufacturer.ilike(pattern),
+            Medicine.brand.ilike(pattern),
+        )), None
+    return query.join(matches, matches.c.medicine_id == Medicine.id), matches.c.rank
+
+
+def search_medicines(db: Session, query: Query, term: str) -> Query:
+    """The medicines of a query matching ``term``, best matches first"""
+    query, rank = match_medicines(db, query, term)
+    return query if rank is None else query.order_by(rank)
+
+
+def search_batches(db: Session, query: Query, term: str) -> Query:
+    """
+    Filter a Batch-and-Medicine query in expiry order (the grid) to the
+    medicines or batch numbers matching ``term``.
+    """
+    matches = medicine_matches(db, term)
+    if matches is None:
+        if not search_tokens(term):
+            return query
+        pattern = f"%{term.lower()}%"
+        return query.filter(or_(
+            func.lower(Medicine.name).like(pattern),
+            func.lower(Medicine.sku).like(pattern),
+            func.lower(Batch.batch_number).like(pattern),
+        ))
+    medicine_id, batch_id = Batch.medicine_id, Batch.id
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite sorts every matching batch by default. Broad terms match
+        # densely enough to stop early on the expiry index instead, so the
+        # "+ 0" keeps the planner off the medicine_id and id indexes.
+        dense = select(func.count()).select_from(
+            select(matches.c.medicine_id).limit(DENSE_MATCH_MEDICINES).subquery()
+        )
+        if db.execute(dense).scalar() >= DENSE_MATCH_MEDICINES:
+            medicine_id, batch_id = medicine_id + 0, batch_id + 0
+    return query.filter(or_(
+        medicine_id.in_(select(matches.c.medicine_id)),
+        batch_id.in_(batch_matches(db, term)),
+    ))
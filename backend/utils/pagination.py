@@ -0,0 +1,111 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+A list is ordered by a unique sort key, e.g. (created_at, id). When there
+are more rows, the key of a page's last row is returned as an opaque token
+in the ``X-Next-Cursor`` header (bodies stay plain lists). Passing it back
+as ``cursor`` continues after that row with a range condition on the key
+instead of an OFFSET, so a deep page costs the same as the first one.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import DateTime, String, and_, literal, or_, tuple_, type_coerce
+from sqlalchemy.orm import Query, Session
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+
+# (expression, descending)
+SortKey = Tuple[Any, bool]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = [{"dt": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """The sort key values of a cursor; 400 if it is malformed or from another ordering"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError("wrong key size")
+        return [datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value for value in payload]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def reject_skip(skip: Optional[int]):
+    """
+    Offset paging was replaced by cursors. FastAPI ignores unknown query
+    parameters, so a client still sending ``skip`` would get the first page
+    again and again; it gets a 400 instead.
+    """
+    if skip is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"skip is no longer supported; pass the {NEXT_CURSOR_HEADER} header of a page as cursor"
+        )
+
+
+def _comparable(expression, dialect: str):
+    # SQLite stores datetimes as text in more than one format (server
+    # defaults have no microseconds); compare the stored text, which is
+    # also the index order
+    if dialect == "sqlite" and isinstance(expression.type, DateTime):
+        return type_coerce(expression, String)
+    return expression
+
+
+def _after(keys: List[SortKey], values: List[Any]):
+    """Rows after ``values`` in the order of ``keys``"""
+    bound = [literal(value, type_=expression.type) for (expression, _), value in zip(keys, values)]
+    directions = {descending for _, descending in keys}
+    if len(directions) == 1:
+        # One direction: a row-value comparison, which can seek an index
+        row = tuple_(*(expression for expression, _ in keys))
+        return row < tuple_(*bound) if directions.pop() else row > tuple_(*bound)
+    conditions = []
+    for i, (expression, descending) in enumerate(keys):
+        equal = [keys[j][0] == bound[j] for j in range(i)]
+        conditions.append(and_(*equal, expression < bound[i] if descending else expression > bound[i]))
+    return or_(*conditions)
+
+
+def paginate(
+    db: Session,
+    query: Query,
+    keys: List[SortKey],
+    cursor: Optional[str],
+    limit: int,
+    response: Response,
+) -> list:
+    """
+    One page of ``query`` ordered by ``keys`` (the last must be unique),
+    starting after ``cursor``. Sets the next cursor header when more rows
+    follow. Returns the query's rows (entities, or tuples of them).
+    """
+    dialect = db.get_bind().dialect.name
+    keys = [(_comparable(expression, dialect), descending) for expression, descending in keys]
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        query = query.filter(_after(keys, decode_cursor(cursor, len(keys))))
+    width = len(query.column_descriptions)
+    rows = (
+        query.add_columns(*(expression for expression, _ in keys))
+        .order_by(*(expression.desc() if descending else expression.asc() for expression, descending in keys))
+        .limit(limit + 1)
+        .all()
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1][width:])
+    return [row[0] if width == 1 else tuple(row[:width]) for row in rows]
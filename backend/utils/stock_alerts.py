@@ -0,0 +1,153 @@
+"""
+Low-stock and expiry alerts for a set of medicines.
+
+The rules are those of the system scan (``/api/alerts/run-system-scan``),
+which evaluates every active medicine. Stock comes from the
+``medicine_stock_summary`` projection. Uploads only evaluate the medicines
+and batches they touched, on a background thread after the import has
+committed, so alerts stay current without a catalog-wide rescan per file.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import Alert, AlertType, Batch, Medicine, MedicineStockSummary
+
+# Thresholds: Critical=0, High<15
+LOW_STOCK_THRESHOLD = 15
+QUERY_CHUNK_SIZE = 500
+
+# (medicine_id, batch_number)
+BatchKey = Tuple[int, str]
+
+# One thread: evaluations never race each other into duplicate alerts
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alerts")
+
+
+def evaluate_alerts(
+    db: Session,
+    medicine_ids: Optional[Iterable[int]] = None,
+    batch_keys: Optional[Set[BatchKey]] = None,
+) -> int:
+    """
+    Create the missing low-stock, stock-out and expiry alerts and commit.
+
+    ``medicine_ids`` limits the evaluation to those medicines (None: every
+    active medicine) and ``batch_keys`` limits the expiry check to those
+    batches. Unacknowledged alerts are not duplicated. Returns the number
+    of alerts created.
+    """
+    now = datetime.now()
+    if medicine_ids is None:
+        scopes: List[Optional[List[int]]] = [None]
+    else:
+        ids = sorted(set(medicine_ids))
+        scopes = [ids[start:start + QUERY_CHUNK_SIZE] for start in range(0, len(ids), QUERY_CHUNK_SIZE)]
+
+    alerts_created = 0
+    for ids in scopes:
+        alerts_created += _evaluate_scope(db, ids, batch_keys, now)
+    db.commit()
+    return alerts_created
+
+
+def _evaluate_scope(db: Session, ids: Optional[List[int]], batch_keys: Optional[Set[BatchKey]], now: datetime) -> int:
+    def scoped(query, column):
+        return query if ids is None else query.filter(column.in_(ids))
+
+    names = dict(scoped(
+        db.query(Medicine.id, Medicine.name).filter(Medicine.is_active == True), Medicine.id
+    ).all())
+    if not names:
+        return 0
+
+    stock = dict(scoped(
+        db.query(MedicineStockSummary.medicine_id, MedicineStockSummary.sellable_quantity),
+        MedicineStockSummary.medicine_id
+    ).all())
+
+    open_alerts = scoped(
+        db.query(Alert.medicine_id, Alert.alert_type, Alert.message).filter(
+            Alert.alert_type.in_([AlertType.LOW_STOCK, AlertType.STOCK_OUT, AlertType.EXPIRY_WARNING]),
+            Alert.is_acknowledged == False
+        ), Alert.medicine_id
+    ).all()
+    stock_alerted = {medicine_id for medicine_id, alert_type, _ in open_alerts if alert_type != AlertType.EXPIRY_WARNING}
+    # Expiry alerts are deduplicated by message, like the system scan
+    expiry_alerted = {
+        (medicine_id, message) for medicine_id, alert_type, message in open_alerts
+        if alert_type == AlertType.EXPIRY_WARNING
+    }
+
+    alerts = []
+    for medicine_id, name in names.items():
+        if medicine_id in stock_alerted:
+            continue
+        total_stock = stock.get(medicine_id) or 0
+        if total_stock == 0:
+            alerts.append(Alert(
+                alert_type=AlertType.STOCK_OUT,
+                medicine_id=medicine_id,
+                message=f"CRITICAL: {name} is OUT OF STOCK!",
+                severity="critical"
+            ))
+        elif total_stock < LOW_STOCK_THRESHOLD:
+            alerts.append(Alert(
+                alert_type=AlertType.LOW_STOCK,
+                medicine_id=medicine_id,
+                message=f"Low Stock: {name} has only {total_stock} units.",
+                severity="high"
+            ))
+
+    expiring = scoped(
+        db.query(Batch.id, Batch.medicine_id, Batch.batch_number, Batch.expiry_date).filter(
+            Batch.is_expired == False,
+            Batch.is_damaged == False,
+            Batch.expiry_date <= now + timedelta(days=settings.EXPIRY_ALERT_DAYS[0])
+        ), Batch.medicine_id
+    ).all()
+    for batch_id, medicine_id, batch_number, expiry_date in expiring:
+        if medicine_id not in names:
+            continue
+        if batch_keys is not None and (medicine_id, batch_number) not in batch_keys:
+            continue
+        message = f"Batch {batch_number} for {names[medicine_id]} expires on {expiry_date.date()}"
+        if (medicine_id, message) in expiry_alerted:
+            continue
+        expiry_alerted.add((medicine_id, message))
+        days_left = (expiry_date.replace(tzinfo=None) - now).days
+        alerts.append(Alert(
+            alert_type=AlertType.EXPIRY_WARNING,
+            medicine_id=medicine_id,
+            batch_id=batch_id,
+            message=message,
+            severity="critical" if days_left < 7 else "high"
+        ))
+
+    db.add_all(alerts)
+    return len(alerts)
+
+
+def submit_alert_evaluation(medicine_ids: Iterable[int], batch_keys: Optional[Iterable[BatchKey]] = None) -> Future:
+    """Evaluate alerts for these medicines in the background, on their own session"""
+    return _executor.submit(
+        _run_evaluation, set(medicine_ids), set(batch_keys) if batch_keys is not None else None
+    )
+
+
+def _run_evaluation(medicine_ids: Set[int], batch_keys: Optional[Set[BatchKey]]) -> int:
+    db = SessionLocal()
+    try:
+        alerts_created = evaluate_alerts(db, medicine_ids, batch_keys)
+        print(f"DEBUG: Alert evaluation of {len(medicine_ids)} medicines created {alerts_created} alerts")
+        return alerts_created
+    except Exception as e:
+        db.rollback()
+        print(f"WARNING: Failed to generate alerts: {e}")
+        return 0
+    finally:
+        db.close()
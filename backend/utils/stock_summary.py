@@ -0,0 +1,79 @@
+"""
+Per-medicine stock projection (``medicine_stock_summary``).
+
+Every writer that changes batches refreshes the rows of the medicines it
+touched in its own transaction: uploads per committed batch,
+create_transaction, and the expired/damaged endpoints. A refresh recomputes
+the rows from the medicines' batches with one DELETE and one
+INSERT ... SELECT per 500 medicines, so a row never drifts from its batches.
+Readers (stock levels, dashboard, alerts, reorder suggestions, the chatbot)
+look a medicine's stock up instead of summing its batches.
+
+Scripts that edit batches directly should finish with
+``python rebuild_stock_summary.py``.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import and_, case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import Batch, Medicine, MedicineStockSummary
+
+REFRESH_CHUNK_SIZE = 500
+
+SUMMARY_COLUMNS = [
+    "medicine_id",
+    "sellable_quantity",
+    "expired_quantity",
+    "damaged_quantity",
+    "nearest_expiry",
+    "stock_value",
+]
+
+
+def _quantity_where(condition):
+    return func.coalesce(func.sum(case((condition, Batch.quantity), else_=0)), 0)
+
+
+def summary_select(medicine_ids: Optional[list] = None):
+    """SELECT of the summary rows (every medicine when ``medicine_ids`` is None)"""
+    in_stock = Batch.quantity > 0
+    sellable = and_(in_stock, Batch.is_expired == False, Batch.is_damaged == False, Batch.is_recalled == False)
+    sellable_quantity = _quantity_where(sellable)
+    query = select(
+        Medicine.id,
+        sellable_quantity,
+        _quantity_where(and_(in_stock, Batch.is_expired == True)),
+        _quantity_where(and_(in_stock, Batch.is_expired == False, Batch.is_damaged == True)),
+        func.min(case((sellable, Batch.expiry_date))),
+        sellable_quantity * func.coalesce(Medicine.mrp, 0),
+    ).select_from(Medicine).outerjoin(Batch, Batch.medicine_id == Medicine.id)
+    if medicine_ids is not None:
+        query = query.where(Medicine.id.in_(medicine_ids))
+    return query.group_by(Medicine.id)
+
+
+def refresh_stock_summaries(db: Session, medicine_ids: Iterable[int]):
+    """
+    Recompute the summary rows of these medicines in the caller's
+    transaction (the caller commits). Deleted medicines lose their row.
+    """
+    ids = sorted(set(medicine_ids))
+    if not ids:
+        return
+    # Pending ORM changes to batches must be visible to the INSERT ... SELECT
+    db.flush()
+    for start in range(0, len(ids), REFRESH_CHUNK_SIZE):
+        chunk = ids[start:start + REFRESH_CHUNK_SIZE]
+        db.execute(
+            delete(MedicineStockSummary).where(MedicineStockSummary.medicine_id.in_(chunk)),
+            execution_options={"synchronize_session": False},
+        )
+        db.execute(insert(MedicineStockSummary).from_select(SUMMARY_COLUMNS, summary_select(chunk)))
+
+
+def rebuild_stock_summaries(db) -> int:
+    """Recompute the whole table (Session or Connection; the caller commits)"""
+    db.execute(delete(MedicineStockSummary), execution_options={"synchronize_session": False})
+    db.execute(insert(MedicineStockSummary).from_select(SUMMARY_COLUMNS, summary_select()))
+    return db.execute(select(func.count()).select_from(MedicineStockSummary)).scalar()
@@ -0,0 +1,265 @@
+"""
+Multi-file and zip-archive uploads.
+
+Stores send one export each per night. A batch upload takes all of them (or
+one zip) in a single request. Parsing a file into DataFrames is CPU-bound
+pandas work, so files are read in parallel by a process pool
+(``UPLOAD_PARSE_PROCESSES``, default: one per core). Workers spill each
+parsed chunk to a temp file, and the importer reads the chunks back one at a
+time, so memory stays bounded by the chunk size. They are applied in file order on one session through the same bulk ingest path
+as single uploads: SQLite has a single writer, and each file keeps its own
+checkpoint, row numbers and result.
+"""
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from config import settings
+from utils.column_profiles import UploadLayout, detect_layout, header_fingerprint, known_layouts, resolve_layout
+from utils.ingestion import UploadReport, import_frames, read_upload
+from utils.upload_readers import READ_BLOCK_SIZE, SUPPORTED_EXTENSIONS
+
+ARCHIVE_EXTENSIONS = ('.zip',)
+
+# (filename, path, sha256) of an upload saved to disk
+SavedUpload = Tuple[str, str, str]
+# (filename, path, sha256, error, bytes): files that cannot be parsed carry an
+# error; bytes is the share of the upload (the compressed size of zip members)
+BatchEntry = Tuple[str, Optional[str], Optional[str], Optional[str], int]
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def check_batch_format(filename: str):
+    """Batch uploads accept zip archives besides the single-upload formats"""
+    if not (filename or '').lower().endswith(SUPPORTED_EXTENSIONS + ARCHIVE_EXTENSIONS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported file format. Please upload Excel, CSV, JSON, Parquet or Arrow files, or .zip archives of them."
+        )
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        # spawn: forking the threaded server could copy held locks into the workers
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=settings.UPLOAD_PARSE_PROCESSES or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_pool
+
+
+def _spill_frame(frame: pd.DataFrame, chunk_dir: str, number: int) -> str:
+    """Write a parsed chunk to disk: parquet, or pickle for what parquet cannot hold"""
+    path = os.path.join(chunk_dir, f"{number:06d}.parquet")
+    try:
+        frame.to_parquet(path)
+        return path
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        # No pyarrow, or mixed-type object columns (e.g. Excel cells)
+        if os.path.exists(path):
+            os.remove(path)
+    path = os.path.join(chunk_dir, f"{number:06d}.pkl")
+    frame.to_pickle(path)
+    return path
+
+
+def _read_frame(path: str) -> pd.DataFrame:
+    return pd.read_parquet(path) if path.endswith(".parquet") else pd.read_pickle(path)
+
+
+def read_spilled_frames(paths: List[str]) -> Iterator[pd.DataFrame]:
+    """The chunks a worker spilled, one at a time; each file is removed once read"""
+    for path in paths:
+        try:
+            frame = _read_frame(path)
+        finally:
+            os.remove(path)
+        yield frame
+
+
+def parse_upload_path(
+    filename: str, path: str, chunk_rows: int, layouts: Dict[str, UploadLayout], chunk_dir: str
+) -> dict:
+    """
+    Process-pool worker: read one saved upload into its header, layout and
+    the paths of its chunks, spilled to ``chunk_dir``. Workers have no
+    session, so layouts are looked up in the snapshot of the profile
+    registry and unknown headers are detected.
+    """
+    headers = []
+
+    def resolve(header: List[str]) -> UploadLayout:
+        headers.append(list(header))
+        return layouts.get(header_fingerprint(header)) or detect_layout(header)
+
+    try:
+        os.makedirs(chunk_dir, exist_ok=True)
+        with open(path, "rb") as stream:
+            layout, frames = read_upload(filename, stream, chunk_rows, resolve)
+            paths = [_spill_frame(frame, chunk_dir, number) for number, frame in enumerate(frames)]
+            return {"header": headers[0], "layout": layout, "paths": paths}
+    except HTTPException as e:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        return {"detail": e.detail}
+    except Exception as e:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+        return {"detail": f"Error parsing file: {str(e)}"}
+
+
+def _is_archive_metadata(name: str) -> bool:
+    return name.startswith("__MACOSX/") or os.path.basename(name).startswith(".")
+
+
+def _extract_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo, workdir: str) -> Tuple[str, str]:
+    """Copy a member to its own temp file (never to its archive path) and hash it"""
+    fd, path = tempfile.mkstemp(dir=workdir, suffix=os.path.splitext(member.filename)[1])
+    digest = hashlib.sha256()
+    with os.fdopen(fd, "wb") as out, archive.open(member) as source:
+        for block in iter(lambda: source.read(READ_BLOCK_SIZE), b""):
+            digest.update(block)
+            out.write(block)
+    return path, digest.hexdigest()
+
+
+def expand_archives(files: List[SavedUpload], workdir: str) -> List[BatchEntry]:
+    """The batch's files in order, with each zip archive replaced by its members"""
+    entries: List[BatchEntry] = []
+    for filename, path, file_hash in files:
+        size = os.path.getsize(path)
+        if not filename.lower().endswith(ARCHIVE_EXTENSIONS):
+            entries.append((filename, path, file_hash, None, size))
+            continue
+        try:
+            with zipfile.ZipFile(path) as archive:
+                members = [m for m in archive.infolist() if not m.is_dir() and not _is_archive_metadata(m.filename)]
+                if sum(m.file_size for m in members) > settings.MAX_UPLOAD_SIZE:
+                    entries.append((filename, None, None, "Archive expands beyond the maximum upload size", size))
+                    continue
+                for member in members:
+                    name = f"{filename}/{member.filename}"
+                    if not member.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                        entries.append((name, None, None, "Unsupported file format", member.compress_size))
+                        continue
+                    entries.append((name, *_extract_member(archive, member, workdir), None, member.compress_size))
+        except zipfile.BadZipFile:
+            entries.append((filename, None, None, "Not a valid zip archive", size))
+    return entries
+
+
+def _chunk_dir(workdir: str, index: int) -> str:
+    return os.path.join(workdir, f"chunks-{index}")
+
+
+def _parsed_in_order(
+    entries: List[BatchEntry], chunk_rows: int, layouts: Dict[str, UploadLayout], workdir: str
+) -> Iterator[dict]:
+    """
+    Parse results in file order. Only a few files per worker are parsed
+    ahead of the importer, which bounds the chunks waiting on disk.
+    """
+    pool = get_parse_pool()
+    window = 2 * (settings.UPLOAD_PARSE_PROCESSES or os.cpu_count() or 1)
+    pending: deque = deque()
+    for index, (filename, path, _, error, _) in enumerate(entries):
+        if error:
+            future = Future()
+            future.set_result({"detail": error})
+        else:
+            future = pool.submit(parse_upload_path, filename, path, chunk_rows, layouts, _chunk_dir(workdir, index))
+        pending.append(future)
+        if len(pending) > window:
+            yield _parse_result(pending.popleft())
+    while pending:
+        yield _parse_result(pending.popleft())
+
+
+def _parse_result(future: Future) -> dict:
+    try:
+        return future.result()
+    except Exception as e:
+        # e.g. a worker killed by the OS; the pool must be recreated
+        global _parse_pool
+        print(f"ERROR: Parse worker failed: {e}")
+        _parse_pool = None
+        return {"detail": f"Error parsing file: {str(e)}"}
+
+
+def process_upload_batch(
+    db: Session,
+    files: List[SavedUpload],
+    user_id: int,
+    progress: Optional[Callable[[UploadReport, int], None]] = None,
+    dry_run: bool = False,
+    resume: bool = True,
+) -> dict:
+    """
+    Import several saved uploads (and the members of zip archives).
+
+    Files are parsed in parallel and imported one after another. A file
+    that fails to parse or import is reported in its own entry of "files"
+    and does not stop the others. ``progress`` is called after every file
+    with the combined report and the bytes of the files done so far.
+    """
+    chunk_rows = settings.UPLOAD_CHUNK_ROWS
+    workdir = tempfile.mkdtemp(prefix="upload-batch-")
+    try:
+        entries = expand_archives(files, workdir)
+        if not entries:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The upload contains no files"
+            )
+        layouts = known_layouts(db)
+        report = UploadReport()
+        results = []
+        bytes_done = 0
+        parsed_files = _parsed_in_order(entries, chunk_rows, layouts, workdir)
+        for index, ((filename, path, file_hash, _, size), parsed) in enumerate(zip(entries, parsed_files)):
+            if "detail" in parsed:
+                results.append({"filename": filename, "status": "failed", "detail": parsed["detail"]})
+            else:
+                try:
+                    # Store the profile of a header the workers did not know
+                    resolve_layout(parsed["header"], db, save=not dry_run)
+                    result = import_frames(
+                        db, filename, parsed["layout"], read_spilled_frames(parsed["paths"]), user_id,
+                        dry_run=dry_run, file_hash=file_hash, resume=resume,
+                    )
+                    report.merge(result, prefix=f"{filename}: ")
+                    results.append({"filename": filename, "status": "completed", **result})
+                except HTTPException as e:
+                    db.rollback()
+                    results.append({"filename": filename, "status": "failed", "detail": e.detail})
+                except Exception as e:
+                    db.rollback()
+                    print(f"ERROR: Batch upload of {filename} failed: {e}")
+                    results.append({"filename": filename, "status": "failed", "detail": f"Error processing file: {str(e)}"})
+            # Chunks an import did not reach (a failure) are not needed again
+            shutil.rmtree(_chunk_dir(workdir, index), ignore_errors=True)
+            bytes_done += size
+            if progress:
+                progress(report, bytes_done)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = sum(1 for result in results if result["status"] == "failed")
+    response = report.as_response("batch")
+    response["message"] = "Dry run completed - no changes were made" if dry_run else "Batch upload completed"
+    response["file_count"] = len(results)
+    response["failed_files"] = failed
+    response["files"] = results
+    if dry_run:
+        response["dry_run"] = True
+    return response
@@ -0,0 +1,255 @@
+"""
+Background upload jobs.
+
+Uploads are copied to a temporary file and imported by a small worker pool so
+the request returns immediately and the event loop is never blocked by pandas
+or SQLAlchemy work. Job state lives in memory; clients poll
+``GET /api/inventory/upload/jobs/{job_id}`` until the job finishes.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+from config import settings
+from database import SessionLocal
+from utils.ingestion import UploadReport, process_upload
+from utils.upload_batch import SavedUpload, process_upload_batch
+
+
+class UploadJob:
+    """Progress and outcome of one background upload"""
+
+    def __init__(
+        self,
+        filename: str,
+        path: str,
+        user_id: int,
+        dry_run: bool = False,
+        file_hash: Optional[str] = None,
+        resume: bool = True,
+    ):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.user_id = user_id
+        self.dry_run = dry_run
+        self.file_hash = file_hash
+        self.resume = resume
+        self.status = "queued"
+        self.total_bytes = os.path.getsize(path) if path else 0
+        self.bytes_processed = 0
+        self.rows_processed = 0
+        self.success_count = 0
+        self.error_count = 0
+        self.warning_count = 0
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.result: Optional[dict] = None
+        self.detail: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.future: Optional[Future] = None
+        self._started = None
+        self._lock = threading.Lock()
+
+    def update(self, report: UploadReport, bytes_processed: int):
+        with self._lock:
+            self.rows_processed = report.total_rows
+            self.success_count = report.success_count
+            self.error_count = report.error_count
+            self.warning_count = report.warning_count
+            self.errors = list(report.errors)
+            self.warnings = list(report.warnings)
+            self.bytes_processed = min(bytes_processed, self.total_bytes)
+
+    def file_hashes(self) -> set:
+        return {self.file_hash} - {None}
+
+    def run(self, db) -> dict:
+        with open(self.path, "rb") as stream:
+            return process_upload(
+                db,
+                self.filename,
+                stream,
+                self.user_id,
+                progress=lambda report: self.update(report, stream.tell()),
+                dry_run=self.dry_run,
+                file_hash=self.file_hash,
+                resume=self.resume,
+            )
+
+    def remove_files(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def progress(self) -> float:
+        if self.status == "completed":
+            return 1.0
+        if not self.total_bytes:
+            return 0.0
+        return self.bytes_processed / self.total_bytes
+
+    def eta_seconds(self) -> Optional[float]:
+        """Estimate the remaining time from the share of the file read so far"""
+        if self.status == "completed":
+            return 0.0
+        fraction = self.progress()
+        if self.status != "running" or fraction <= 0:
+            return None
+        elapsed = time.monotonic() - self._started
+        return round(elapsed * (1 - fraction) / fraction, 1)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "filename": self.filename,
+                "dry_run": self.dry_run,
+                "rows_processed": self.rows_processed,
+                "success_count": self.success_count,
+                "error_count": self.error_count,
+                "warning_count": self.warning_count,
+                "errors": self.errors,
+                "warnings": self.warnings,
+                "bytes_processed": self.bytes_processed,
+                "total_bytes": self.total_bytes,
+                "progress": round(self.progress(), 4),
+                "eta_seconds": self.eta_seconds(),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "result": self.result,
+                "detail": self.detail,
+            }
+
+
+class BatchUploadJob(UploadJob):
+    """A multi-file upload; ``files`` are the saved uploads, zip archives included"""
+
+    def __init__(self, files: List[SavedUpload], user_id: int, dry_run: bool = False, resume: bool = True):
+        super().__init__(f"{len(files)} files", None, user_id, dry_run, None, resume)
+        self.files = files
+        self.total_bytes = sum(os.path.getsize(path) for _, path, _ in files)
+
+    def file_hashes(self) -> set:
+        return {file_hash for _, _, file_hash in self.files}
+
+    def run(self, db) -> dict:
+        return process_upload_batch(
+            db,
+            self.files,
+            self.user_id,
+            progress=self.update,
+            dry_run=self.dry_run,
+            resume=self.resume,
+        )
+
+    def remove_files(self):
+        for _, path, _ in self.files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_WORKERS, thread_name_prefix="upload")
+_jobs: Dict[str, UploadJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def submit_upload_job(
+    filename: str,
+    path: str,
+    user_id: int,
+    dry_run: bool = False,
+    file_hash: Optional[str] = None,
+    resume: bool = True,
+) -> UploadJob:
+    """Queue an upload that has already been saved to ``path``"""
+    return _submit(UploadJob(filename, path, user_id, dry_run, file_hash, resume))
+
+
+def submit_batch_upload_job(files: List[SavedUpload], user_id: int, dry_run: bool = False, resume: bool = True) -> UploadJob:
+    """Queue a multi-file upload whose files have already been saved"""
+    return _submit(BatchUploadJob(files, user_id, dry_run, resume))
+
+
+def _submit(job: UploadJob) -> UploadJob:
+    with _jobs_lock:
+        _prune_finished_jobs()
+        running = _active_import(job.file_hashes()) if not job.dry_run else None
+        if running is None:
+            _jobs[job.id] = job
+    if running is not None:
+        # Two imports of one file would share (and fight over) its checkpoint
+        job.remove_files()
+        raise HTTPException(
+            status_code=409,
+            detail=f"This file is already being imported (job {running.id})"
+        )
+    job.future = _executor.submit(_run_job, job)
+    return job
+
+
+def get_upload_job(job_id: str) -> Optional[UploadJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def _run_job(job: UploadJob) -> dict:
+    db = SessionLocal()
+    job.status = "running"
+    job.started_at = datetime.utcnow()
+    job._started = time.monotonic()
+    try:
+        job.result = job.run(db)
+        job.rows_processed = job.result.get("total_rows", job.rows_processed)
+        job.bytes_processed = job.total_bytes
+        job.status = "completed"
+        return job.result
+    except HTTPException as e:
+        job.status = "failed"
+        job.status_code = e.status_code
+        job.detail = e.detail
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"ERROR: Upload job {job.id} failed: {e}")
+        job.status = "failed"
+        job.status_code = 500
+        job.detail = f"Error processing file: {str(e)}"
+        raise
+    finally:
+        job.finished_at = datetime.utcnow()
+        db.close()
+        job.remove_files()
+
+
+def _active_import(file_hashes: set) -> Optional[UploadJob]:
+    if not file_hashes:
+        return None
+    for job in _jobs.values():
+        if not job.dry_run and job.finished_at is None and job.file_hashes() & file_hashes:
+            return job
+    return None
+
+
+def _prune_finished_jobs():
+    now = datetime.utcnow()
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job.finished_at and (now - job.finished_at).total_seconds() > settings.UPLOAD_JOB_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
@@ -0,0 +1,465 @@
+"""
+Chunked readers for uploaded inventory files.
+
+Every reader takes a binary file object and yields DataFrames of at most
+``chunk_rows`` rows, so peak memory depends on the chunk size and not on the
+size of the upload. The index of each chunk continues where the previous one
+stopped, which keeps "Row N" messages pointing at the right line of the file.
+"""
+import codecs
+import importlib.util
+import json
+from datetime import date, datetime
+from typing import BinaryIO, Callable, Iterator, List, Optional
+
+import pandas as pd
+from fastapi import HTTPException, status
+
+from config import settings
+
+
+DEFAULT_CHUNK_ROWS = 50_000
+READ_BLOCK_SIZE = 1024 * 1024  # 1 MB
+
+# A JSON record (or top-level value) may not span more than this many characters
+MAX_JSON_RECORD_SIZE = 16 * 1024 * 1024
+# A value cut off by a read fails to decode, or decodes as a shorter number
+# ("12." of "12.5"), at most this close to the buffer's end ("-Infinit"),
+# except inside a string
+TRUNCATION_WINDOW = 8
+
+# CSV encodings are sniffed from this many leading bytes
+SNIFF_BYTES = 64 * 1024
+
+# utf-32-le's BOM starts with utf-16-le's, so it is checked first
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# The only bytes in 0x80-0x9F that cp1252 leaves undefined
+CP1252_UNDEFINED = frozenset(b'\x81\x8d\x8f\x90\x9d')
+
+
+# Given the header row, returns the columns to load (None = all of them)
+ColumnSelector = Callable[[List[str]], Optional[List[str]]]
+
+ARROW_EXTENSIONS = ('.parquet', '.feather', '.arrow')
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.json') + NDJSON_EXTENSIONS + ARROW_EXTENSIONS
+
+
+def check_upload_format(filename: str):
+    """Reject files whose extension has no reader"""
+    if not (filename or '').lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported file format. Please upload Excel (.xlsx, .xls), CSV (.csv), JSON (.json, .ndjson, .jsonl), Parquet (.parquet) or Arrow (.feather, .arrow) files."
+        )
+
+
+def iter_upload_frames(
+    filename: str,
+    stream: BinaryIO,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    select_columns: Optional[ColumnSelector] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield the uploaded file as DataFrame chunks based on its extension.
+
+    ``select_columns`` lets readers that support it (xlsx) skip the columns
+    nobody will read.
+    """
+    check_upload_format(filename)
+    filename = filename.lower()
+
+    if filename.endswith('.xlsx'):
+        return EXCEL_ENGINES[excel_engine()](stream, chunk_rows, select_columns)
+    elif filename.endswith('.xls'):
+        # Legacy binary Excel has no streaming reader
+        return _split_frame(pd.read_excel(stream), chunk_rows)
+    elif filename.endswith('.csv'):
+        return iter_csv_frames(stream, chunk_rows)
+    elif filename.endswith('.parquet'):
+        return iter_parquet_frames(stream, chunk_rows)
+    elif filename.endswith(ARROW_EXTENSIONS):
+        return iter_arrow_ipc_frames(stream, chunk_rows)
+    else:
+        return iter_json_frames(stream, chunk_rows, lines=filename.endswith(NDJSON_EXTENSIONS))
+
+
+def sniff_encoding(prefix: bytes) -> str:
+    """
+    Guess a CSV's encoding from its first bytes: a BOM if there is one,
+    UTF-16 by its zero bytes, UTF-8 if the prefix decodes, else a legacy
+    code page (cp1252, or latin-1 if bytes undefined in cp1252 appear).
+    """
+    for bom, encoding in BOM_ENCODINGS:
+        if prefix.startswith(bom):
+            return encoding
+
+    # ASCII text in UTF-16 has a zero in every other byte
+    half = len(prefix) // 2
+    if half:
+        even_zeros, odd_zeros = prefix[0::2].count(0), prefix[1::2].count(0)
+        if odd_zeros > half * 0.4 and even_zeros < half * 0.05:
+            return 'utf-16-le'
+        if even_zeros > half * 0.4 and odd_zeros < half * 0.05:
+            return 'utf-16-be'
+
+    try:
+        # final=False: the prefix may end inside a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    # cp1252 maps 0x80-0x9F to punctuation (€ ‘ ’ “ ” –) where latin-1 has
+    # control characters, so it is the better guess for legacy exports
+    if CP1252_UNDEFINED.intersection(prefix):
+        return 'latin-1'
+    return 'cp1252'
+
+
+def _decode_legacy_bytes(error: UnicodeDecodeError):
+    """
+    Decode error handler: bytes the sniffed encoding rejects (e.g. a cp1252
+    line after a UTF-8 prefix) are read as cp1252 instead of failing the
+    upload half way through.
+    """
+    chunk = error.object[error.start:error.end]
+    text = ''.join(chr(b) if b in CP1252_UNDEFINED else bytes([b]).decode('cp1252') for b in chunk)
+    return text, error.end
+
+
+codecs.register_error('upload_legacy_bytes', _decode_legacy_bytes)
+
+
+def iter_csv_frames(stream: BinaryIO, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Read a CSV in chunks, decoding it once with the encoding sniffed from its prefix"""
+    prefix = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    encoding = sniff_encoding(prefix)
+    print(f"DEBUG: CSV encoding detected as {encoding}")
+    yield from pd.read_csv(stream, encoding=encoding, encoding_errors='upload_legacy_bytes', chunksize=chunk_rows)
+
+
+def excel_engine() -> str:
+    """
+    The xlsx reader to use: ``settings.EXCEL_ENGINE``, or with "auto" the
+    fastest one installed (calamine, then openpyxl).
+    """
+    engine = settings.EXCEL_ENGINE
+    if engine == 'auto':
+        return 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unknown EXCEL_ENGINE {engine!r}, expected one of: auto, {', '.join(EXCEL_ENGINES)}")
+    return engine
+
+
+def iter_xlsx_frames(
+    stream: BinaryIO,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    select_columns: Optional[ColumnSelector] = None,
+) -> Iterator[pd.DataFrame]:
+    """Iterate the first worksheet with openpyxl's read-only mode (rows are never all in memory)"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield from _sheet_frames(header, rows, 0, chunk_rows, select_columns)
+    finally:
+        workbook.close()
+
+
+def iter_xlsx_frames_calamine(
+    stream: BinaryIO,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    select_columns: Optional[ColumnSelector] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Iterate the first worksheet with python-calamine (parsed in Rust). Cells
+    are converted to the values openpyxl returns, so both engines produce the
+    same frames.
+    """
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_filelike(stream)
+    try:
+        sheet = workbook.get_sheet_by_index(0)
+        rows = sheet.iter_rows()
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [_calamine_cell(col) for col in header]
+        # calamine starts at the first used row; keep indexes on sheet rows
+        first_row = sheet.start[0] if sheet.start else 0
+        yield from _sheet_frames(header, rows, first_row, chunk_rows, select_columns, _calamine_cell)
+    finally:
+        workbook.close()
+
+
+def _calamine_cell(value):
+    # calamine returns '' for empty cells, floats for whole numbers and
+    # dates for date-only cells
+    if value == '':
+        return None
+    if type(value) is float and value.is_integer():
+        return int(value)
+    if type(value) is date:
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def _sheet_frames(
+    header,
+    rows: Iterator,
+    first_row: int,
+    chunk_rows: int,
+    select_columns: Optional[ColumnSelector],
+    convert: Optional[Callable] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Turn worksheet rows into DataFrame chunks, keeping only the selected
+    columns. ``convert`` is applied to the kept cells only.
+    """
+    columns = [
+        str(col) if col is not None else f"Unnamed: {i}"
+        for i, col in enumerate(header)
+    ]
+    selected = select_columns(columns) if select_columns else None
+    positions = [columns.index(col) for col in selected] if selected is not None else range(len(columns))
+    names = [columns[i] for i in positions]
+
+    buffer: List[list] = []
+    index: List[int] = []
+    # Index = sheet row - 2, same as pd.read_excel for sheets without gaps.
+    # Blank rows are skipped before selecting columns so row numbers do not
+    # depend on which columns are loaded.
+    for row_idx, values in enumerate(rows, start=first_row):
+        if all(v is None or v == '' for v in values):
+            continue
+        row = [values[i] if i < len(values) else None for i in positions]
+        buffer.append([convert(v) for v in row] if convert else row)
+        index.append(row_idx)
+        if len(buffer) >= chunk_rows:
+            yield pd.DataFrame(buffer, columns=names, index=index)
+            buffer, index = [], []
+    if buffer:
+        yield pd.DataFrame(buffer, columns=names, index=index)
+
+
+EXCEL_ENGINES = {
+    'calamine': iter_xlsx_frames_calamine,
+    'openpyxl': iter_xlsx_frames,
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parquet and Arrow uploads require the pyarrow package on the server."
+        )
+    return pyarrow
+
+
+def iter_parquet_frames(stream: BinaryIO, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Read a Parquet file row group by row group, keeping its column types"""
+    pa = _import_pyarrow()
+    parquet_file = pa.parquet.ParquetFile(stream)
+    yield from _arrow_frames(parquet_file.iter_batches(batch_size=chunk_rows), chunk_rows)
+
+
+def iter_arrow_ipc_frames(stream: BinaryIO, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Read an Arrow IPC file (Feather v2) or stream record batch by record batch"""
+    pa = _import_pyarrow()
+    try:
+        reader = pa.ipc.open_file(stream)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        # Not the random-access file format: try the streaming format
+        stream.seek(0)
+        batches = pa.ipc.open_stream(stream)
+    yield from _arrow_frames(batches, chunk_rows)
+
+
+def _arrow_frames(batches, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Convert Arrow record batches to DataFrames of at most ``chunk_rows`` rows.
+
+    Numbers, dates and timestamps keep their types, so the ingestion engine
+    takes its typed fast paths instead of parsing strings.
+    """
+    offset = 0
+    for batch in batches:
+        for start in range(0, batch.num_rows, chunk_rows):
+            # Slicing a record batch is zero-copy
+            piece = batch.slice(start, chunk_rows)
+            frame = piece.to_pandas(date_as_object=False)
+            frame.index = pd.RangeIndex(offset, offset + len(frame))
+            offset += len(frame)
+            yield frame
+
+
+def iter_json_frames(stream: BinaryIO, chunk_rows: int = DEFAULT_CHUNK_ROWS, lines: bool = False) -> Iterator[pd.DataFrame]:
+    """Parse JSON records incrementally, yielding fixed-size DataFrame chunks"""
+    records = []
+    offset = 0
+    for record in iter_json_records(stream, lines):
+        records.append(record)
+        if len(records) >= chunk_rows:
+            yield _records_frame(records, offset)
+            offset += len(records)
+            records = []
+    if records:
+        yield _records_frame(records, offset)
+
+
+def iter_json_records(stream: BinaryIO, lines: bool = False) -> Iterator:
+    """
+    Yield JSON records without loading the file.
+
+    A top-level array yields its elements and an ``{"items": [...]}`` object
+    its items, both streamed; any other object is a single record. With
+    ``lines`` (NDJSON), or after the first document of a ``.json`` file,
+    every top-level value is a record.
+    """
+    parser = _IncrementalJSON(stream)
+    first = parser.peek()
+    if not lines and first == '[':
+        yield from _iter_json_array(parser)
+    elif not lines and first == '{':
+        yield from _iter_json_object(parser)
+
+    # Newline-delimited records (NDJSON)
+    while parser.peek() != '':
+        yield parser.decode_value()
+
+
+def _iter_json_array(parser: "_IncrementalJSON") -> Iterator:
+    parser.advance()
+    if parser.peek() == ']':
+        parser.advance()
+        return
+    while True:
+        yield parser.decode_value()
+        separator = parser.peek()
+        parser.advance()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"Invalid JSON: expected ',' or ']' but found {separator!r}")
+
+
+def _iter_json_object(parser: "_IncrementalJSON") -> Iterator:
+    """Stream the "items" array of an object, or yield the object itself"""
+    parser.advance()
+    record = {}
+    streamed = False
+    if parser.peek() == '}':
+        parser.advance()
+        yield record
+        return
+    while True:
+        key = parser.decode_value()
+        if parser.peek() != ':':
+            raise ValueError(f"Invalid JSON: expected ':' after key {key!r}")
+        parser.advance()
+        if key == 'items' and parser.peek() == '[':
+            yield from _iter_json_array(parser)
+            streamed = True
+        else:
+            record[key] = parser.decode_value()
+        separator = parser.peek()
+        parser.advance()
+        if separator == '}':
+            break
+        if separator != ',':
+            raise ValueError(f"Invalid JSON: expected ',' or '}}' but found {separator!r}")
+    if not streamed:
+        yield record
+
+
+class _IncrementalJSON:
+    """Small buffered tokenizer on top of json.JSONDecoder.raw_decode"""
+
+    def __init__(self, stream: BinaryIO, encoding: str = 'utf-8'):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        block = self.stream.read(READ_BLOCK_SIZE)
+        if not block:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(b'', final=True)
+        else:
+            self.buffer = self.buffer[self.pos:] + self.decoder.decode(block)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character ('' at end of input)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n\ufeff':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def advance(self):
+        self.pos += 1
+
+    def _truncated(self, error: json.JSONDecodeError) -> bool:
+        """Whether a decode error may come from a value cut off by the last read"""
+        return error.msg.startswith('Unterminated string') or error.pos >= len(self.buffer) - TRUNCATION_WINDOW
+
+    def decode_value(self):
+        self.peek()  # raw_decode does not skip leading whitespace
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # A value ending near the buffer edge may be truncated
+                # (e.g. a number split across two reads)
+                if end < len(self.buffer) - TRUNCATION_WINDOW or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                # An error before the end of the buffer is malformed input;
+                # reading more would only pull the rest of the file in
+                if self.eof or not self._truncated(e):
+                    raise
+            if len(self.buffer) - self.pos > MAX_JSON_RECORD_SIZE:
+                raise ValueError(
+                    f"Invalid JSON: a record is larger than {MAX_JSON_RECORD_SIZE // (1024 * 1024)} MB or never ends"
+                )
+            self._fill()
+
+
+def _records_frame(records: List, offset: int) -> pd.DataFrame:
+    frame = pd.DataFrame(records)
+    frame.index = pd.RangeIndex(offset, offset + len(frame))
+    return frame
+
+
+def _split_frame(df: pd.DataFrame, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
@@ -1,8 +1,10 @@
 import { apiClient } from './client'
 import { mockMedicines } from './mockData'
 
+const UPLOAD_POLL_INTERVAL_MS = 1000
+
 export const inventoryApi = {
-  uploadFile: async (file) => {
+  uploadFile: async (file, onProgress) => {
     const formData = new FormData()
     formData.append('file', file)
 
@@ -15,8 +17,20 @@ export const inventoryApi = {
       const response = await apiClient.post('/api/inventory/upload', formData, {
         timeout: 300000, // 5 minutes for large files
       })
-      console.log('DEBUG: Upload success:', response.data)
-      return response.data
+
+      // The upload is processed in the background; poll until the job finishes
+      let job = response.data
+      while (job.status === 'queued' || job.status === 'running') {
+        if (onProgress) onProgress(job)
+        await new Promise((resolve) => setTimeout(resolve, UPLOAD_POLL_INTERVAL_MS))
+        job = await inventoryApi.getUploadJob(job.job_id)
+      }
+      if (onProgress) onProgress(job)
+      if (job.status === 'failed') {
+        throw new Error(job.detail || 'Upload failed')
+      }
+      console.log('DEBUG: Upload success:', job.result)
+      return job.result
     } catch (error) {
       console.error('DEBUG: Upload FAILED', error)
       if (error.response) {
@@ -41,6 +55,11 @@ export const inventoryApi = {
     }
   },
 
+  getUploadJob: async (jobId) => {
+    const response = await apiClient.get(`/api/inventory/upload/jobs/${jobId}`)
+    return response.data
+  },
+
   uploadExcel: async (file) => {
     return inventoryApi.uploadFile(file)
   },
@@ -75,9 +94,12 @@ export const inventoryApi = {
     return response.data
   },
 
-  getStockLevels: async (lowStockOnly) => {
+  // One page of stock levels; pass medicine_id (an array) for the medicines on screen
+  getStockLevels: async (params) => {
     const response = await apiClient.get('/api/inventory/stock-levels', {
-      params: { low_stock_only: lowStockOnly },
+      params,
+      // medicine_id=1&medicine_id=2, the form FastAPI reads as a list
+      paramsSerializer: { indexes: null },
     })
     return response.data
   },
@@ -19,12 +19,43 @@ export interface Batch {
   is_expired: boolean
 }
 
+export interface UploadJob {
+  job_id: string
+  status: 'queued' | 'running' | 'completed' | 'failed'
+  rows_processed: number
+  error_count: number
+  warning_count: number
+  errors: string[]
+  warnings: string[]
+  progress: number
+  eta_seconds?: number | null
+  result?: any
+  detail?: string | null
+}
+
 export const inventoryApi = {
-  uploadFile: async (file: File) => {
+  uploadFile: async (file: File, onProgress?: (job: UploadJob) => void) => {
     const formData = new FormData()
     formData.append('file', file)
     // Removed /api prefix as it is already in baseURL
     const response = await apiClient.post('/inventory/upload', formData)
+
+    // The upload is processed in the background; poll until the job finishes
+    let job: UploadJob = response.data
+    while (job.status === 'queued' || job.status === 'running') {
+      onProgress?.(job)
+      await new Promise((resolve) => setTimeout(resolve, 1000))
+      job = await inventoryApi.getUploadJob(job.job_id)
+    }
+    onProgress?.(job)
+    if (job.status === 'failed') {
+      throw new Error(job.detail || 'Upload failed')
+    }
+    return job.result
+  },
+
+  getUploadJob: async (jobId: string): Promise<UploadJob> => {
+    const response = await apiClient.get(`/inventory/upload/jobs/${jobId}`)
     return response.data
   },
 
@@ -48,9 +79,12 @@ export const inventoryApi = {
     return response.data
   },
 
-  getStockLevels: async (lowStockOnly?: boolean) => {
+  // One page of stock levels; pass medicine_id for the medicines on screen
+  getStockLevels: async (params?: { low_stock_only?: boolean; medicine_id?: number[]; limit?: number }) => {
     const response = await apiClient.get('/inventory/stock-levels', {
-      params: { low_stock_only: lowStockOnly },
+      params,
+      // medicine_id=1&medicine_id=2, the form FastAPI reads as a list
+      paramsSerializer: { indexes: null },
     })
     return response.data
   },
@@ -0,0 +1,15 @@
+// Keep in sync with MAX_UPLOAD_SIZE in backend/config.py (uploads are streamed to disk)
+export const MAX_UPLOAD_SIZE = 10 * 1024 * 1024 * 1024
+
+export const formatUploadSize = (bytes) => {
+  const units = ['B', 'KB', 'MB', 'GB']
+  let size = bytes
+  let unit = 0
+  while (size >= 1024 && unit < units.length - 1) {
+    size /= 1024
+    unit += 1
+  }
+  return `${Number.isInteger(size) ? size : size.toFixed(1)}${units[unit]}`
+}
+
+export const MAX_UPLOAD_SIZE_LABEL = formatUploadSize(MAX_UPLOAD_SIZE)
@@ -1,6 +1,7 @@
 import { useState, useCallback } from 'react'
 import { useMutation, useQueryClient } from '@tanstack/react-query'
 import { inventoryApi } from '../api/inventory'
+import { MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE_LABEL } from '../api/uploadLimits'
 import toast from 'react-hot-toast'
 
 interface FileUploadProps {
@@ -105,18 +106,17 @@ export default function FileUpload({ onSuccess, onClose }: FileUploadProps) {
 
   const validateAndSetFile = (file: File) => {
     // Check file type
-    const validExtensions = ['.xlsx', '.xls', '.csv', '.json']
+    const validExtensions = ['.xlsx', '.xls', '.csv', '.json', '.ndjson', '.jsonl', '.parquet', '.feather', '.arrow']
     const fileExtension = '.' + file.name.split('.').pop()?.toLowerCase()
 
     if (!validExtensions.includes(fileExtension)) {
-      toast.error('Invalid file type. Please upload Excel (.xlsx, .xls), CSV (.csv), or JSON (.json) files.')
+      toast.error('Invalid file type. Please upload Excel (.xlsx, .xls), CSV (.csv), JSON (.json, .ndjson, .jsonl), Parquet (.parquet) or Arrow (.feather, .arrow) files.')
       return
     }
 
-    // Check file size (10MB limit)
-    const maxSize = 10 * 1024 * 1024
-    if (file.size > maxSize) {
-      toast.error('File size exceeds 10MB limit.')
+    // Check file size (same limit as the backend)
+    if (file.size > MAX_UPLOAD_SIZE) {
+      toast.error(`File size exceeds ${MAX_UPLOAD_SIZE_LABEL} limit.`)
       return
     }
 
@@ -271,13 +271,13 @@ export default function FileUpload({ onSuccess, onClose }: FileUploadProps) {
                     </span>
                     <input
                       type="file"
-                      accept=".xlsx,.xls,.csv,.json"
+                      accept=".xlsx,.xls,.csv,.json,.ndjson,.jsonl,.parquet,.feather,.arrow"
                       onChange={handleFileSelect}
                       className="hidden"
                     />
                   </label>
                   <p className="text-xs text-gray-500 mt-2">
-                    Supported formats: Excel (.xlsx, .xls), CSV (.csv), JSON (.json) • Max size: 10MB
+                    Supported formats: Excel (.xlsx, .xls), CSV (.csv), JSON (.json, .ndjson, .jsonl), Parquet, Arrow • Max size: {MAX_UPLOAD_SIZE_LABEL}
                   </p>
                 </div>
               )}
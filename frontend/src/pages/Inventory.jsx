@@ -26,15 +26,6 @@ export default function Inventory() {
     refetchInterval: 15000,
   })
 
-  const { data: stockLevels, refetch: refetchStockLevels } = useQuery({
-    queryKey: ['stock-levels'],
-    queryFn: async () => {
-      const result = await inventoryApi.getStockLevels()
-      return result || []
-    },
-    refetchInterval: 15000,
-  })
-
   // Fetch Categories
   const { data: categories } = useQuery({
     queryKey: ['categories'],
@@ -255,7 +246,6 @@ export default function Inventory() {
           onSuccess={() => {
             setShowUploadModal(false)
             refetchMedicines()
-            refetchStockLevels()
           }}
           onClose={() => setShowUploadModal(false)}
         />
@@ -13,9 +13,12 @@ export default function Inventory() {
     queryFn: () => inventoryApi.getMedicines({ search: searchTerm, category: selectedCategory }),
   })
 
+  // Stock of the listed medicines only, not the whole catalogue
+  const medicineIds = (medicines || []).map((medicine: any) => medicine.id)
   const { data: stockLevels } = useQuery({
-    queryKey: ['stock-levels'],
-    queryFn: () => inventoryApi.getStockLevels(),
+    queryKey: ['stock-levels', medicineIds],
+    queryFn: () => inventoryApi.getStockLevels({ medicine_id: medicineIds, limit: medicineIds.length }),
+    enabled: medicineIds.length > 0,
   })
 
   return (